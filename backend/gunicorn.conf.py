@@ -0,0 +1,43 @@
+"""
+gunicorn 正式環境設定：
+
+    gunicorn -c gunicorn.conf.py libmanagesystem.asgi:application
+
+- 預設以 uvicorn worker 執行 ASGI 應用；GUNICORN_WORKER_CLASS=gthread 並改用
+  libmanagesystem.wsgi:application 則為 WSGI 多執行緒模式，GUNICORN_THREADS 為每個 worker 的執行緒數。
+- preload_app：在 master 載入 Django（含 OpenCV / numpy）後再 fork，worker 以 copy-on-write 共用記憶體。
+- keepalive 須大於 nginx upstream 的 keepalive_timeout，避免 nginx 重用已被 gunicorn 關閉的連線。
+- 館藏版本、用戶首頁快取、token 撤銷、登入限流都存在 Django cache；未設定 REDIS_URL 時快取在行程內，
+  多個 worker 會各自為政，因此只啟動一個 worker。
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+# uvicorn worker 各有一個 event loop，約與 CPU 核心數相同即可
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+requested_workers = workers
+if workers > 1 and not os.environ.get('REDIS_URL'):
+    workers = 1
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# 定期重啟 worker，避免長時間執行後的記憶體成長；jitter 讓各 worker 錯開重啟
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    if requested_workers != workers:
+        server.log.warning('未設定 REDIS_URL，快取無法在 worker 間共用，WEB_CONCURRENCY=%s 改為 1 個 worker', requested_workers)
+
+
+def post_fork(server, worker):
+    # master 載入應用時若開過資料庫連線，不能與 worker 共用
+    from django.db import connections
+    connections.close_all()
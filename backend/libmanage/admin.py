@@ -1,7 +1,30 @@
 from django.contrib import admin
-from .models import Book, BorrowRecord
+from .models import Book, BorrowRecord, Copy
 
 # Register your models here.
 
-admin.site.register(Book)
-admin.site.register(BorrowRecord)
\ No newline at end of file
+
+class CopyInline(admin.TabularInline):
+    # 複本數量由借還書 API 與 inventory.add_copies 以 F() 維護，後台只顯示、可編輯館藏條碼
+    model = Copy
+    fields = ('barcode', 'is_borrowed')
+    readonly_fields = ('is_borrowed',)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Book)
+class BookAdmin(admin.ModelAdmin):
+    list_display = ('title', 'author', 'isbn', 'status', 'available_copies', 'total_copies')
+    readonly_fields = ('total_copies', 'available_copies')
+    inlines = [CopyInline]
+
+    def get_readonly_fields(self, request, obj=None):
+        # 新增書籍時可指定複本數，之後只能經由 API 新增複本
+        return () if obj is None else self.readonly_fields
+
+
+admin.site.register(BorrowRecord)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LibmanageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libmanage'
+
+    def ready(self):
+        from . import signals  # noqa: F401  註冊 signal handlers
@@ -0,0 +1,318 @@
+"""
+回應快取。
+
+- 用戶首頁 (user_home_api) 的預設頁面依用戶、世代號與日期快取序列化後的 JSON 與 ETag，
+  借閱紀錄異動時由 signals.py 及批次借還書 API 遞增該用戶的世代號，舊世代的快取不再被讀取並自然過期。
+- 館藏版本號：任何書籍異動都會遞增，書籍列表 / 詳細資料的 ETag 由版本號產生，
+  完整書籍列表另在行程內保存序列化（與壓縮）後的位元組。
+  版本號存在 Django cache，多個 worker 時請設定 REDIS_URL 讓版本號共用。
+- ISBN 熱門查詢：行程內的 LRU + TTL 快取，掃描條碼時以 ISBN 取得書籍資料，
+  書籍異動時由 signal 與借還書 API 清除。每個項目記錄寫入時的館藏版本號，
+  版本號不同（其他 worker 異動過館藏）即視為未命中，回應不會以新版本的 ETag 標記舊資料。
+- 名稱以 a 開頭的函式為 async view 使用的版本（Django cache 的 aget / aset）。
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+DASHBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOGUE_VERSION_KEY = 'catalogue_version'
+ISBN_CACHE_MAX_ENTRIES = 4096
+ISBN_CACHE_TTL = 60
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_etag(body):
+    return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def not_modified(etag, cache_control):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def cached_json_response(request, body, etag, cache_control):
+    """
+    回傳已序列化的 JSON；If-None-Match 符合時回傳 304。
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def dashboard_generation_key(user_id):
+    return f'user_home_generation:{user_id}'
+
+
+def dashboard_cache_key(user_id, generation, current_date=None):
+    # is_overdue 隨日期改變，因此 key 包含日期，跨日自動失效
+    current_date = current_date or timezone.now().date()
+    return f'user_home:{user_id}:{generation}:{current_date.isoformat()}'
+
+
+def get_dashboard_generation(user_id):
+    """
+    用戶首頁快取的世代號，借閱紀錄異動時遞增。查詢資料庫之前取得，
+    建立的快取存在這個世代的 key 下；查詢期間若有異動，晚寫入的舊資料落在不再被讀取的舊世代。
+    """
+    key = dashboard_generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # 快取被清除後以目前時間重新起算，不會與先前的世代號重複
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_dashboard_generation(user_id):
+    key = dashboard_generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def get_dashboard(user_id, generation):
+    """
+    回傳 (etag, body) 或 None。
+    """
+    return cache.get(dashboard_cache_key(user_id, generation))
+
+
+async def aget_dashboard(user_id, generation):
+    return await cache.aget(dashboard_cache_key(user_id, generation))
+
+
+def set_dashboard(user_id, generation, body):
+    etag = make_etag(body)
+    cache.set(dashboard_cache_key(user_id, generation), (etag, body), DASHBOARD_CACHE_TIMEOUT)
+    return etag
+
+
+async def aset_dashboard(user_id, generation, body):
+    etag = make_etag(body)
+    await cache.aset(dashboard_cache_key(user_id, generation), (etag, body), DASHBOARD_CACHE_TIMEOUT)
+    return etag
+
+
+def _incr_dashboard_generations(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate_dashboards(user_ids):
+    keys = [dashboard_generation_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    # 立即遞增讓同一個請求之後讀到新資料；交易提交後再遞增一次，
+    # 其他請求在提交前以舊資料建立的快取屬於舊世代，不會再被讀取
+    _incr_dashboard_generations(keys)
+    transaction.on_commit(lambda: _incr_dashboard_generations(keys))
+
+
+def get_catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        # 快取被清除後以目前時間重新起算，不會與先前發出的版本號重複
+        cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+async def aget_catalogue_version():
+    version = await cache.aget(CATALOGUE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def _incr_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_catalogue_version():
+    """
+    書籍異動後呼叫；交易提交後再遞增一次，避免其他請求以提交前的資料建立新版本的快照。
+    """
+    _incr_catalogue_version()
+    transaction.on_commit(_incr_catalogue_version)
+
+
+def catalogue_etag(version, encoding=None):
+    return f'"catalogue-{version}-{encoding}"' if encoding else f'"catalogue-{version}"'
+
+
+def choose_encoding(request):
+    accept = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accept:
+        return 'br'
+    if 'gzip' in accept:
+        return 'gzip'
+    return None
+
+
+class CatalogueSnapshot:
+    """
+    行程內保存最新版本的完整書籍列表位元組，依 Accept-Encoding 延遲產生壓縮版本。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.bodies = {}
+
+    def peek(self, version, encoding):
+        """
+        已有該版本與編碼的位元組時直接回傳，否則回傳 None（不會查詢資料庫）。
+        """
+        with self.lock:
+            if self.version != version:
+                return None
+            return self.bodies.get(encoding)
+
+    def get(self, version, encoding, build):
+        with self.lock:
+            if self.version != version:
+                self.version = version
+                self.bodies = {None: build()}
+            if encoding not in self.bodies:
+                body = self.bodies[None]
+                if encoding == 'gzip':
+                    self.bodies[encoding] = gzip.compress(body, compresslevel=6)
+                elif encoding == 'br':
+                    self.bodies[encoding] = brotli.compress(body)
+            return self.bodies[encoding]
+
+
+catalogue_snapshot = CatalogueSnapshot()
+
+
+class IsbnCache:
+    """
+    正規化 ISBN → 書籍資料的 LRU 快取，項目超過 ttl 秒即視為過期。
+    get / set 帶館藏版本號時，版本號不同的項目視為過期（stale）；清除只在本行程生效，版本號則由所有 worker 共用。
+    另記錄書籍 id 對應的 ISBN，書籍修改 ISBN 時也能以 id 清除舊項目。
+    """
+    def __init__(self, max_entries=ISBN_CACHE_MAX_ENTRIES, ttl=ISBN_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.isbn_by_book = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    def get(self, isbn, version=None):
+        with self.lock:
+            entry = self.entries.get(isbn)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, entry_version, book_data = entry
+            if expires <= self.clock():
+                self._remove(isbn)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if version is not None and entry_version != version:
+                self._remove(isbn)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(isbn)
+            self.hits += 1
+            return book_data
+
+    def set(self, isbn, book_data, version=None):
+        with self.lock:
+            self._remove(isbn)
+            self.entries[isbn] = (self.clock() + self.ttl, version, book_data)
+            self.isbn_by_book[book_data['id']] = isbn
+            while len(self.entries) > self.max_entries:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_books(self, book_ids, isbns=()):
+        with self.lock:
+            for book_id in book_ids:
+                isbn = self.isbn_by_book.get(book_id)
+                if isbn is not None:
+                    self._remove(isbn)
+            for isbn in isbns:
+                self._remove(isbn)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.isbn_by_book.clear()
+
+    def _remove(self, isbn):
+        entry = self.entries.pop(isbn, None)
+        if entry is not None:
+            book_id = entry[2]['id']
+            if self.isbn_by_book.get(book_id) == isbn:
+                del self.isbn_by_book[book_id]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale': self.stale,
+            }
+
+
+isbn_cache = IsbnCache()
+
+
+def books_changed(book_ids, isbns=()):
+    """
+    書籍資料變更（含借出 / 歸還）後呼叫：遞增館藏版本號並清除這些書的 ISBN 快取。
+    """
+    book_ids = list(book_ids)
+    isbns = [isbn for isbn in isbns if isbn]
+    bump_catalogue_version()
+    isbn_cache.invalidate_books(book_ids, isbns)
+    transaction.on_commit(lambda: isbn_cache.invalidate_books(book_ids, isbns))
@@ -0,0 +1,196 @@
+"""
+館藏與借閱紀錄匯出（CSV / JSONL / Parquet）。
+
+以 iterator(chunk_size=...) 逐批讀取（PostgreSQL 上為伺服器端游標），每批寫出後即丟棄，
+記憶體用量與資料量無關。Parquet 需要安裝 pyarrow，每批寫成一個 row group。
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Book, BorrowRecord
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+EXPORT_EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl', 'parquet': 'parquet'}
+
+# 每個資料表匯出的欄位與型別（型別供 Parquet schema 使用）
+EXPORT_TABLES = {
+    'books': [
+        ('id', 'int'),
+        ('title', 'str'),
+        ('author', 'str'),
+        ('isbn', 'str'),
+        ('total_copies', 'int'),
+        ('available_copies', 'int'),
+        ('category', 'str'),
+        ('status', 'str'),
+    ],
+    'borrow_records': [
+        ('id', 'int'),
+        ('user_id', 'int'),
+        ('username', 'str'),
+        ('book_id', 'int'),
+        ('book_title', 'str'),
+        ('book_isbn', 'str'),
+        ('borrow_date', 'date'),
+        ('due_date', 'date'),
+        ('return_date', 'date'),
+        ('returned', 'bool'),
+    ],
+}
+# 輸出欄位名稱對應的關聯欄位
+EXPORT_ALIASES = {
+    'username': 'user__username',
+    'book_title': 'book__title',
+    'book_isbn': 'book__isbn',
+}
+
+
+def parse_date_param(value):
+    """
+    解析 YYYY-MM-DD，空值回傳 None，格式錯誤拋出 ValueError。
+    """
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+def export_queryset(table, date_from=None, date_to=None):
+    fields = [name for name, _ in EXPORT_TABLES[table] if name not in EXPORT_ALIASES]
+    aliases = {name: F(path) for name, path in EXPORT_ALIASES.items() if name in dict(EXPORT_TABLES[table])}
+    if table == 'books':
+        return Book.objects.order_by('id').values(*fields, **aliases)
+    records = BorrowRecord.objects.order_by('id')
+    if date_from:
+        records = records.filter(borrow_date__gte=date_from)
+    if date_to:
+        records = records.filter(borrow_date__lte=date_to)
+    return records.values(*fields, **aliases)
+
+
+def iter_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class LineBuffer:
+    """
+    csv.writer 的寫入目標，直接回傳寫入的字串（Django 文件中的 Echo 寫法）。
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(table, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(LineBuffer())
+    fields = [name for name, _ in EXPORT_TABLES[table]]
+    # 加上 BOM 讓 Excel 正確辨識中文
+    yield ('\ufeff' + writer.writerow(fields)).encode('utf-8')
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield ''.join(writer.writerow([row[name] for name in fields]) for row in chunk).encode('utf-8')
+
+
+def stream_jsonl(table, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in chunk
+        ).encode('utf-8')
+
+
+class ParquetSink:
+    """
+    只累積位元組的輸出檔，讓 ParquetWriter 每寫完一個 row group 就能取出並送出。
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(table):
+    import pyarrow as pa
+    types = {'int': pa.int64(), 'str': pa.string(), 'bool': pa.bool_(), 'date': pa.date32()}
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_TABLES[table]])
+
+
+def stream_parquet(table, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(table)
+    sink = ParquetSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    try:
+        for chunk in iter_chunks(queryset, chunk_size):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_export(table, fmt, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    回傳匯出內容的位元組產生器。table / fmt 不支援時拋出 ValueError。
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f'不支援的資料表：{table}')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'不支援的格式：{fmt}')
+    if fmt == 'parquet' and not parquet_available():
+        raise ValueError('匯出 Parquet 需要安裝 pyarrow')
+
+    queryset = export_queryset(table, date_from, date_to)
+    streamers = {'csv': stream_csv, 'jsonl': stream_jsonl, 'parquet': stream_parquet}
+    return streamers[fmt](table, queryset, chunk_size)
+
+
+def export_filename(table, fmt):
+    return f'{table}-{timezone.localdate().isoformat()}.{EXPORT_EXTENSIONS[fmt]}'
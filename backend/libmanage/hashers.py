@@ -0,0 +1,61 @@
+"""
+密碼雜湊。
+
+- 新密碼使用 settings.PASSWORD_HASHERS 的第一個演算法（由環境變數 PASSWORD_HASHER 選擇），
+  參數可由環境變數調整；舊演算法或舊參數的雜湊會在登入成功時自動重算。
+- 雜湊計算佔用 CPU，async view 透過有上限的 thread pool 執行，
+  避免在 ASGI 下卡住事件迴圈或佔用唯一的 sync thread（hashlib / argon2 計算時會釋放 GIL）。
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, ScryptPasswordHasher, make_password, verify_password,
+)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+hashing_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or min(4, os.cpu_count() or 1),
+    thread_name_prefix='password-hashing',
+)
+
+
+async def run_in_hashing_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(hashing_pool, func, *args)
+
+
+async def amake_password(password):
+    return await run_in_hashing_pool(make_password, password)
+
+
+async def acheck_user_password(user, password):
+    """
+    驗證密碼；若雜湊使用舊演算法或舊參數，以目前設定重新雜湊並只更新 password 欄位。
+    """
+    is_correct, must_update = await run_in_hashing_pool(verify_password, password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return is_correct
@@ -0,0 +1,217 @@
+"""
+書籍批次匯入（CSV / JSONL / MARC）。
+
+逐列讀取、驗證後分批寫入：每批以一次 isbn_normalized__in 查詢排除資料庫中已存在的 ISBN，
+再於同一個 transaction 內 bulk_create（書籍與複本）。bulk_create 不會觸發 signal，因此匯入後直接更新檢索索引與館藏版本號。
+選填欄位 copies 為複本數（預設 1）。
+"""
+import csv
+import io
+import json
+
+from django.db import IntegrityError, transaction
+
+from . import caching, inventory, search
+from .isbn import normalize_isbn
+from .models import Book, Copy
+
+IMPORT_FORMATS = ('csv', 'jsonl', 'marc')
+IMPORT_BATCH_SIZE = 1000
+
+CATEGORY_VALUES = {choice[0] for choice in Book.CATEGORY_CHOICES}
+STATUS_VALUES = {choice[0] for choice in Book.STATUS_CHOICES}
+TITLE_MAX_LENGTH = Book._meta.get_field('title').max_length
+AUTHOR_MAX_LENGTH = Book._meta.get_field('author').max_length
+ISBN_MAX_LENGTH = Book._meta.get_field('isbn').max_length
+
+
+class ReadableStream(io.RawIOBase):
+    """
+    將只有 read(n) 的物件（例如 HttpRequest）包成二進位串流，TextIOWrapper 與 MARCReader 可逐塊讀取，
+    不必先把整個請求內容讀進記憶體（request.body 另受 DATA_UPLOAD_MAX_MEMORY_SIZE 限制）。
+    """
+    def __init__(self, source):
+        self.source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def guess_format(filename='', content_type=''):
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    if name.endswith(('.mrc', '.marc')) or 'marc' in content_type:
+        return 'marc'
+    return None
+
+
+def iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(text):
+        yield row
+
+
+def iter_jsonl(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    for line in text:
+        line = line.strip()
+        if not line:
+            yield None
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield ValueError('無效的 JSON')
+            continue
+        yield row if isinstance(row, dict) else ValueError('每一行必須是 JSON 物件')
+
+
+def marc_subfield(record, tag, code):
+    for field in record.get_fields(tag):
+        values = field.get_subfields(code)
+        if values:
+            return values[0].strip(' /:;,.')
+    return ''
+
+
+def iter_marc(stream):
+    try:
+        from pymarc import MARCReader
+    except ImportError:
+        raise ValueError('匯入 MARC 需要安裝 pymarc')
+    for record in MARCReader(stream, to_unicode=True, force_utf8=True):
+        if record is None:
+            yield ValueError('無法解析的 MARC 紀錄')
+            continue
+        yield {
+            'title': marc_subfield(record, '245', 'a'),
+            'author': marc_subfield(record, '100', 'a') or marc_subfield(record, '110', 'a'),
+            # 020$a 常帶有裝訂說明，例如 "9786263337695 (平裝)"
+            'isbn': marc_subfield(record, '020', 'a').split(' ')[0],
+        }
+
+
+def iter_rows(stream, fmt):
+    """
+    依格式逐列產生 dict；無法解析的列以 ValueError 物件表示，空白列為 None。
+    stream 須為二進位檔案物件。
+    """
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt == 'jsonl':
+        return iter_jsonl(stream)
+    if fmt == 'marc':
+        return iter_marc(stream)
+    raise ValueError(f'不支援的格式：{fmt}')
+
+
+def build_book(row):
+    """
+    驗證單列資料並建立（尚未儲存的）Book，不合法時拋出 ValueError。
+    """
+    title = str(row.get('title') or '').strip()
+    author = str(row.get('author') or '').strip()
+    isbn = str(row.get('isbn') or '').strip()
+    category = str(row.get('category') or 'OTHER').strip()
+    status = str(row.get('status') or 'AVAILABLE').strip()
+    copies = str(row.get('copies') or '1').strip()
+
+    if not title or not author or not isbn:
+        raise ValueError('書名、作者、ISBN 為必填')
+    if len(title) > TITLE_MAX_LENGTH or len(author) > AUTHOR_MAX_LENGTH or len(isbn) > ISBN_MAX_LENGTH:
+        raise ValueError('欄位長度超過限制')
+    if category not in CATEGORY_VALUES:
+        raise ValueError(f'無效的書籍分類：{category}')
+    if status not in STATUS_VALUES:
+        raise ValueError(f'無效的書籍狀態：{status}')
+    if not copies.isdigit() or not 1 <= int(copies) <= inventory.MAX_NEW_COPIES:
+        raise ValueError(f'複本數必須介於 1 與 {inventory.MAX_NEW_COPIES} 之間：{copies}')
+
+    isbn_normalized = normalize_isbn(isbn)
+    if isbn_normalized is None:
+        raise ValueError(f'無效的 ISBN：{isbn}')
+
+    # bulk_create 不會呼叫 save()，需自行填入 isbn_normalized 與可借複本數
+    return Book(
+        title=title, author=author, isbn=isbn, category=category, status=status,
+        isbn_normalized=isbn_normalized, total_copies=int(copies), available_copies=int(copies),
+    )
+
+
+def insert_batch(batch, errors, batch_size=IMPORT_BATCH_SIZE):
+    """
+    寫入一批 (列號, Book)，回傳成功建立的 Book 串列。
+    """
+    normalized = [book.isbn_normalized for _, book in batch]
+    existing = set(Book.objects.filter(isbn_normalized__in=normalized).values_list('isbn_normalized', flat=True))
+    pending = []
+    for line, book in batch:
+        if book.isbn_normalized in existing:
+            errors.append({'row': line, 'message': f'ISBN 已存在：{book.isbn}'})
+        else:
+            pending.append((line, book))
+    if not pending:
+        return []
+
+    try:
+        with transaction.atomic():
+            created = Book.objects.bulk_create([book for _, book in pending], batch_size=batch_size)
+            Copy.objects.bulk_create(
+                [Copy(book=book) for book in created for _ in range(book.total_copies)], batch_size=batch_size,
+            )
+            search.index_books([book for book in created if book.pk is not None])
+            caching.bump_catalogue_version()
+    except IntegrityError:
+        # 查重與寫入之間有其他請求寫入相同 ISBN，改為逐筆寫入以找出衝突的列（save() 會經由 signal 更新索引）
+        created = []
+        for line, book in pending:
+            try:
+                with transaction.atomic():
+                    book.save()
+                created.append(book)
+            except IntegrityError:
+                errors.append({'row': line, 'message': f'ISBN 已存在：{book.isbn}'})
+    return created
+
+
+def import_books(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    匯入 iter_rows() 產生的資料，回傳 {'created': 筆數, 'errors': [{'row': 列號, 'message': 原因}]}。
+    列號從 1 起算（CSV 不含標題列）。
+    """
+    created = 0
+    errors = []
+    seen = set()
+    batch = []
+    for line, row in enumerate(rows, start=1):
+        if row is None:
+            continue
+        if isinstance(row, ValueError):
+            errors.append({'row': line, 'message': str(row)})
+            continue
+        try:
+            book = build_book(row)
+        except ValueError as e:
+            errors.append({'row': line, 'message': str(e)})
+            continue
+        if book.isbn_normalized in seen:
+            errors.append({'row': line, 'message': f'檔案內 ISBN 重複：{book.isbn}'})
+            continue
+        seen.add(book.isbn_normalized)
+        batch.append((line, book))
+        if len(batch) >= batch_size:
+            created += len(insert_batch(batch, errors, batch_size))
+            batch = []
+    if batch:
+        created += len(insert_batch(batch, errors, batch_size))
+    errors.sort(key=lambda error: error['row'])
+    return {'created': created, 'errors': errors}
@@ -0,0 +1,79 @@
+"""
+館藏複本與可借數量。
+
+每本書 (Book) 有一或多個複本 (Copy)。Book.total_copies / available_copies 為反正規化的計數，
+借還書時與 Copy.is_borrowed 在同一個交易內以 F() 運算式更新，不會有讀取後再寫回的競爭；
+判斷「是否還有可借複本」與書籍列表只需讀取 Book 一列。
+queryset.update() 不會觸發 signal，呼叫端須自行清除快取（caching.books_changed）。
+"""
+from collections import Counter
+
+from django.db.models import BooleanField, Case, ExpressionWrapper, F, Q, Value, When
+
+from .models import Book, Copy
+
+# 單次新增書籍 / 匯入一列時最多建立的複本數
+MAX_NEW_COPIES = 500
+# API 回傳的 is_borrowed（相容舊欄位）：所有複本都已借出
+IS_BORROWED = ExpressionWrapper(Q(available_copies=0), output_field=BooleanField())
+
+
+def borrowable(queryset):
+    return queryset.filter(status='AVAILABLE', available_copies__gt=0)
+
+
+def not_borrowable(queryset):
+    # borrowable() 的補集：狀態不是 AVAILABLE，或所有複本都已借出
+    return queryset.exclude(status='AVAILABLE', available_copies__gt=0)
+
+
+def checkout_copies(book_ids):
+    """
+    每本書借出一個複本，回傳 {book_id: copy_id}；任一本書已無可借複本時回傳 None（呼叫端須回滾交易）。
+    須在交易內呼叫。先以條件式 UPDATE 扣減可借數量，同一本書的其他借書交易會在這一列上等待，
+    因此接著挑選的未借出複本不會被重複借出（SQLite 的寫入本來就是序列化的）。
+    """
+    book_ids = set(book_ids)
+    updated = borrowable(Book.objects.filter(id__in=book_ids)).update(available_copies=F('available_copies') - 1)
+    if updated != len(book_ids):
+        return None
+    copies = {}
+    for copy_id, book_id in Copy.objects.filter(book_id__in=book_ids, is_borrowed=False).order_by('id').values_list('id', 'book_id'):
+        copies.setdefault(book_id, copy_id)
+    if len(copies) != len(book_ids):
+        # 計數與複本不一致（例如直接修改過資料庫），不借出
+        return None
+    Copy.objects.filter(id__in=copies.values()).update(is_borrowed=True)
+    return copies
+
+
+def checkin_copies(records):
+    """
+    歸還借閱紀錄 (book_id, copy_id) 對應的複本並增加可借數量；狀態改回 AVAILABLE（已損壞或遺失者維持原狀）。
+    同一本書可能同時歸還多個複本，依歸還數量分組，每組一次 UPDATE。
+    """
+    records = list(records)
+    copy_ids = [copy_id for _, copy_id in records if copy_id is not None]
+    if copy_ids:
+        Copy.objects.filter(id__in=copy_ids).update(is_borrowed=False)
+    returned = Counter(book_id for book_id, _ in records)
+    by_count = {}
+    for book_id, count in returned.items():
+        by_count.setdefault(count, []).append(book_id)
+    for count, book_ids in by_count.items():
+        Book.objects.filter(id__in=book_ids).update(
+            available_copies=F('available_copies') + count,
+            status=Case(When(status__in=['DAMAGED', 'LOST'], then=F('status')), default=Value('AVAILABLE')),
+        )
+    return list(returned)
+
+
+def add_copies(book, count):
+    """
+    為既有書籍新增 count 個複本。
+    """
+    Copy.objects.bulk_create([Copy(book=book) for _ in range(count)])
+    Book.objects.filter(id=book.id).update(
+        total_copies=F('total_copies') + count,
+        available_copies=F('available_copies') + count,
+    )
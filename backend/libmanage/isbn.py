@@ -0,0 +1,40 @@
+"""
+ISBN 正規化：移除連字號與空白，ISBN-10 一律轉為 ISBN-13，
+讓同一本書不論輸入哪種格式都對應到同一個唯一索引值。
+"""
+import re
+
+ISBN_STRIP_RE = re.compile(r'[\s-]+')
+
+
+def isbn10_is_valid(value):
+    if not re.fullmatch(r'[0-9]{9}[0-9X]', value):
+        return False
+    total = sum((10 - i) * (10 if ch == 'X' else int(ch)) for i, ch in enumerate(value))
+    return total % 11 == 0
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(ch) * (1 if i % 2 == 0 else 3) for i, ch in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def is_isbn13(value):
+    # 978 / 979 開頭且檢查碼正確；一般商品的 EAN-13 條碼不算
+    return bool(re.fullmatch(r'97[89][0-9]{10}', value)) and isbn13_check_digit(value[:12]) == value[12]
+
+
+def normalize_isbn(value):
+    """
+    回傳正規化後的 ISBN；空值回傳 None。
+    無法辨識為合法 ISBN-10 的字串只做去除連字號與轉大寫，不會拒絕（舊資料可能不合規）。
+    """
+    if value is None:
+        return None
+    value = ISBN_STRIP_RE.sub('', str(value)).upper()
+    if not value:
+        return None
+    if isbn10_is_valid(value):
+        first12 = '978' + value[:9]
+        return first12 + isbn13_check_digit(first12)
+    return value
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# 對照組：SQLite 預設的 rollback journal 與 Django 預設的 DEFERRED 交易
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def connect(path, pragmas, busy_timeout):
+    conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def create_database(path, books):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute(
+        'CREATE TABLE book (id INTEGER PRIMARY KEY, title TEXT, author TEXT, isbn TEXT, '
+        "is_borrowed INTEGER NOT NULL DEFAULT 0, category TEXT, status TEXT NOT NULL DEFAULT 'AVAILABLE')"
+    )
+    conn.execute(
+        'CREATE TABLE record (id INTEGER PRIMARY KEY, book_id INTEGER, user_id INTEGER, '
+        'borrow_date TEXT, returned INTEGER NOT NULL DEFAULT 0)'
+    )
+    conn.executemany(
+        "INSERT INTO book (title, author, isbn, category) VALUES (?, ?, ?, 'OTHER')",
+        [(f'Book {i}', f'Author {i % 50}', f'978{i:010d}') for i in range(books)],
+    )
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = '比較 SQLite 預設設定與 settings.SQLITE_PRAGMAS（WAL 等）在同時讀寫時的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='讀取執行緒數（模擬書籍列表）')
+        parser.add_argument('--writers', type=int, default=4, help='寫入執行緒數（模擬借書 / 還書）')
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--books', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        db_options = settings.DATABASES['default'].get('OPTIONS', {})
+        busy_timeout = db_options.get('timeout', 5)
+        configs = [
+            ('預設 (DELETE journal, DEFERRED)', DEFAULT_PRAGMAS, 'BEGIN'),
+            ('調校 (SQLITE_PRAGMAS, IMMEDIATE)', settings.SQLITE_PRAGMAS, 'BEGIN IMMEDIATE'),
+        ]
+        for label, pragmas, begin in configs:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                create_database(path, options['books'])
+                reads, writes, locked = self.run(path, pragmas, begin, busy_timeout, options)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{label}：讀取 {reads / seconds:.0f} 次/秒，寫入 {writes / seconds:.0f} 次/秒，'
+                f'database is locked {locked} 次'
+            )
+
+    def run(self, path, pragmas, begin, busy_timeout, options):
+        deadline = time.monotonic() + options['seconds']
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        books = options['books']
+
+        def add(key):
+            with lock:
+                counts[key] += 1
+
+        def reader(seed):
+            conn = connect(path, pragmas, busy_timeout)
+            cursor = seed * 97 % books
+            while time.monotonic() < deadline:
+                try:
+                    conn.execute(
+                        'SELECT id, title, author, isbn, is_borrowed, category, status FROM book '
+                        'WHERE id > ? ORDER BY id LIMIT 100', [cursor],
+                    ).fetchall()
+                    add('reads')
+                except sqlite3.OperationalError:
+                    add('locked')
+                cursor = (cursor + 100) % books
+            conn.close()
+
+        def writer(seed):
+            conn = connect(path, pragmas, busy_timeout)
+            book_id = seed + 1
+            while time.monotonic() < deadline:
+                try:
+                    # 借書交易會先讀取再寫入；DEFERRED 交易的讀鎖升級為寫鎖失敗時不會等待 busy timeout
+                    conn.execute(begin)
+                    conn.execute('SELECT is_borrowed FROM book WHERE id = ?', [book_id]).fetchone()
+                    conn.execute('UPDATE book SET is_borrowed = 1 - is_borrowed WHERE id = ?', [book_id])
+                    conn.execute(
+                        "INSERT INTO record (book_id, user_id, borrow_date) VALUES (?, ?, date('now'))",
+                        [book_id, seed],
+                    )
+                    conn.execute('COMMIT')
+                    add('writes')
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    add('locked')
+                book_id = book_id % books + 1
+            conn.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['locked']
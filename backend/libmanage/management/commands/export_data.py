@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from libmanage import exporter
+
+
+class Command(BaseCommand):
+    help = '串流匯出館藏 (books) 或借閱紀錄 (borrow_records) 為 CSV / JSONL / Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(exporter.EXPORT_TABLES))
+        parser.add_argument('--format', choices=exporter.EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help='輸出檔案路徑，未指定時寫到標準輸出')
+        parser.add_argument('--date-from', help='借閱日期起 (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='借閱日期迄 (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=exporter.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            date_from = exporter.parse_date_param(options['date_from'])
+            date_to = exporter.parse_date_param(options['date_to'])
+            content = exporter.stream_export(
+                options['table'], options['format'], date_from, date_to, chunk_size=options['chunk_size'],
+            )
+        except ValueError as e:
+            raise CommandError(f'匯出失敗：{e}')
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for data in content:
+                    output.write(data)
+            self.stdout.write(self.style.SUCCESS(f"已匯出至 {options['output']}"))
+        else:
+            for data in content:
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
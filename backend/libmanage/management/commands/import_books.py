@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from libmanage import importer
+
+
+class Command(BaseCommand):
+    help = '從 CSV / JSONL / MARC 檔案批次匯入書籍'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=importer.IMPORT_FORMATS)
+        parser.add_argument('--batch-size', type=int, default=importer.IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or importer.guess_format(path)
+        if fmt is None:
+            raise CommandError('無法由副檔名判斷格式，請指定 --format')
+
+        try:
+            with open(path, 'rb') as stream:
+                result = importer.import_books(importer.iter_rows(stream, fmt), batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(f'無法讀取檔案：{e}')
+        except (ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f'匯入失敗：{e}')
+
+        for error in result['errors']:
+            self.stderr.write(f"第 {error['row']} 列：{error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"已匯入 {result['created']} 本書籍，{len(result['errors'])} 列失敗"
+        ))
@@ -0,0 +1,93 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def slow_request(host, port, target, headers, send_delay, read_rate):
+    """
+    模擬慢速行動網路的客戶端：請求標頭分兩段、間隔 send_delay 秒送出，
+    回應以每秒 read_rate 位元組讀取。回傳 (HTTP 狀態碼, 回應位元組數, 秒數)。
+    """
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        lines = [f'GET {target} HTTP/1.1', f'Host: {host}', 'Connection: close', *headers, '', '']
+        data = '\r\n'.join(lines).encode('utf-8')
+        half = len(data) // 2
+        writer.write(data[:half])
+        await writer.drain()
+        await asyncio.sleep(send_delay)
+        writer.write(data[half:])
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        size = 0
+        while True:
+            chunk = await reader.read(4096)
+            if not chunk:
+                break
+            size += len(chunk)
+            if read_rate:
+                await asyncio.sleep(len(chunk) / read_rate)
+        return status, size, time.perf_counter() - start
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = '以大量慢速客戶端對 API 壓測，比較 WSGI（sync worker）與 ASGI（uvicorn）在高併發下的延遲與吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='例如 http://127.0.0.1:8000/api/books/?page_size=50')
+        parser.add_argument('--clients', type=int, default=100, help='同時連線的客戶端數')
+        parser.add_argument('--requests', type=int, default=5, help='每個客戶端依序送出的請求數')
+        parser.add_argument('--send-delay', type=float, default=0.2, help='請求標頭兩段之間的延遲秒數')
+        parser.add_argument('--read-rate', type=int, default=64 * 1024, help='每秒讀取的位元組數，0 表示不限速')
+        parser.add_argument('--header', '-H', action='append', default=[], help='附加的請求標頭，例如 "Authorization: Bearer ..."')
+        parser.add_argument('--timeout', type=float, default=60, help='單一請求逾時秒數')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('只支援 http:// 網址')
+        target = url.path or '/'
+        if url.query:
+            target += f'?{url.query}'
+
+        results, elapsed = asyncio.run(self.run(url.hostname, url.port or 80, target, options))
+        latencies = sorted(seconds for status, _, seconds in results if isinstance(status, int) and status < 500)
+        failures = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError(f'全部 {len(results)} 個請求失敗')
+
+        self.stdout.write(f"請求數：{len(results)}（失敗 {failures}），總時間 {elapsed:.2f} 秒，{len(latencies) / elapsed:.1f} req/s")
+        self.stdout.write(
+            '延遲（秒）：平均 {:.3f}，p50 {:.3f}，p95 {:.3f}，p99 {:.3f}，最大 {:.3f}'.format(
+                statistics.mean(latencies), percentile(latencies, 0.5), percentile(latencies, 0.95),
+                percentile(latencies, 0.99), latencies[-1],
+            )
+        )
+
+    async def run(self, host, port, target, options):
+        async def client():
+            results = []
+            for _ in range(options['requests']):
+                try:
+                    results.append(await asyncio.wait_for(
+                        slow_request(host, port, target, options['header'], options['send_delay'], options['read_rate']),
+                        options['timeout'],
+                    ))
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+                    results.append((e, 0, None))
+            return results
+
+        start = time.perf_counter()
+        batches = await asyncio.gather(*(client() for _ in range(options['clients'])))
+        return [result for batch in batches for result in batch], time.perf_counter() - start
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from libmanage import search
+from libmanage.models import Book
+
+
+class Command(BaseCommand):
+    help = '以目前所有書籍重建全文檢索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index(Book, using=options['database'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 本書籍的檢索索引'))
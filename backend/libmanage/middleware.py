@@ -0,0 +1,97 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+
+from . import routers, tokens
+
+
+def bearer_principal(request):
+    """
+    解析 Authorization: Bearer <token> 並驗證簽章與期限，尚未檢查是否已撤銷。
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return tokens.decode_token(token.strip())
+
+
+class TokenAuthenticationMiddleware:
+    """
+    將已驗證的 Principal（或 None）放在 request.principal，同時支援 sync 與 async view。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        principal = bearer_principal(request)
+        if principal is not None and tokens.is_revoked(principal, cache.get_many(tokens.revocation_keys(principal))):
+            principal = None
+        request.principal = principal
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        principal = bearer_principal(request)
+        if principal is not None and tokens.is_revoked(principal, await cache.aget_many(tokens.revocation_keys(principal))):
+            principal = None
+        request.principal = principal
+        return await self.get_response(request)
+
+
+class ReadReplicaMiddleware:
+    """
+    以 replica_reads 標記的 GET view 從唯讀副本讀取；用戶剛寫入過（固定在主資料庫期間）則仍讀主資料庫。
+    寫入請求成功後將該用戶固定在主資料庫 READ_REPLICA_PIN_SECONDS 秒。須放在 TokenAuthenticationMiddleware 之後。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routers.begin_request()
+        response = self.get_response(request)
+        user_id = self.written_by(request, response)
+        if user_id is not None:
+            routers.pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        routers.begin_request()
+        response = await self.get_response(request)
+        user_id = self.written_by(request, response)
+        if user_id is not None:
+            await routers.apin_to_primary(user_id)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            routers.replica_alias() is None
+            or not getattr(view_func, 'replica_reads', False)
+            or request.method not in routers.SAFE_METHODS
+        ):
+            return None
+        principal = getattr(request, 'principal', None)
+        if principal is not None and routers.is_pinned(principal.id):
+            return None
+        routers.current_state().use_replica = True
+        return None
+
+    def written_by(self, request, response):
+        """
+        寫入成功時回傳用戶 id，否則 None。
+        """
+        if routers.replica_alias() is None or request.method in routers.SAFE_METHODS or response.status_code >= 400:
+            return None
+        principal = getattr(request, 'principal', None)
+        return principal.id if principal is not None else None
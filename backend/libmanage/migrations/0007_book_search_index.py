@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from libmanage import search
+
+
+def create_search_index(apps, schema_editor):
+    Book = apps.get_model('libmanage', 'Book')
+    search.rebuild_index(Book, using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0006_book_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
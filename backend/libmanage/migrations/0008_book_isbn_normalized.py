@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+from libmanage.isbn import normalize_isbn
+
+
+def populate_isbn_normalized(apps, schema_editor):
+    Book = apps.get_model('libmanage', 'Book')
+    seen = set()
+    changed = []
+    for book in Book.objects.order_by('id').only('id', 'isbn').iterator(chunk_size=2000):
+        normalized = normalize_isbn(book.isbn)
+        # 既有的重複 ISBN 只保留最早一筆的正規化值，其餘留空以免唯一索引建立失敗
+        if normalized is None or normalized in seen:
+            continue
+        seen.add(normalized)
+        book.isbn_normalized = normalized
+        changed.append(book)
+    Book.objects.bulk_update(changed, ['isbn_normalized'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0007_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=17, null=True),
+        ),
+        migrations.RunPython(populate_isbn_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=17, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0008_book_isbn_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['user', 'returned', 'borrow_date'], name='record_user_returned_date_idx'),
+        ),
+    ]
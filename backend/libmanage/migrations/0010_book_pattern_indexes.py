@@ -0,0 +1,42 @@
+"""
+PostgreSQL 專用索引。
+
+書籍列表以 title / author 前綴篩選（LIKE 'abc%'），資料庫 collation 不是 C 時一般 B-tree 索引無法用於前綴比對，
+另外建立 varchar_pattern_ops 索引。以 CONCURRENTLY 建立，不會在建立期間鎖住書籍寫入（因此本遷移不使用交易）。
+其他資料庫不做任何事。
+"""
+from django.db import migrations
+
+PATTERN_INDEXES = [
+    ('book_title_like_idx', 'title'),
+    ('book_author_like_idx', 'author'),
+]
+
+
+def create_pattern_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in PATTERN_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON libmanage_book ({column} varchar_pattern_ops)'
+        )
+
+
+def drop_pattern_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in PATTERN_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('libmanage', '0009_borrowrecord_user_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pattern_indexes, drop_pattern_indexes),
+    ]
@@ -0,0 +1,69 @@
+"""
+新增館藏複本 (Copy) 與書籍的複本計數。
+
+既有的每一筆 Book 即為一個實體複本：為每本書建立一個 Copy（沿用 is_borrowed），
+available_copies 依 is_borrowed 設定，借閱紀錄指向該書的複本。is_borrowed 欄位於 0012 移除。
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def create_copies(apps, schema_editor):
+    Book = apps.get_model('libmanage', 'Book')
+    Copy = apps.get_model('libmanage', 'Copy')
+    BorrowRecord = apps.get_model('libmanage', 'BorrowRecord')
+    db = schema_editor.connection.alias
+    quote = schema_editor.quote_name
+    # 以一次 INSERT ... SELECT 建立複本，不需把書籍讀進 Python
+    schema_editor.execute(
+        f'INSERT INTO {quote(Copy._meta.db_table)} ({quote("book_id")}, {quote("is_borrowed")}) '
+        f'SELECT {quote("id")}, {quote("is_borrowed")} FROM {quote(Book._meta.db_table)}'
+    )
+    Book.objects.using(db).filter(is_borrowed=True).update(available_copies=0)
+    BorrowRecord.objects.using(db).update(
+        copy_id=Subquery(Copy.objects.using(db).filter(book_id=OuterRef('book_id')).values('id')[:1])
+    )
+
+
+def restore_is_borrowed(apps, schema_editor):
+    Book = apps.get_model('libmanage', 'Book')
+    Book.objects.using(schema_editor.connection.alias).filter(available_copies=0).update(is_borrowed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0010_book_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Copy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(blank=True, max_length=32, null=True, unique=True, verbose_name='館藏條碼')),
+                ('is_borrowed', models.BooleanField(default=False)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='libmanage.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'is_borrowed'], name='copy_book_borrowed_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='館藏複本數'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='可借複本數'),
+        ),
+        migrations.AddField(
+            model_name='borrowrecord',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='records', to='libmanage.copy'),
+        ),
+        migrations.RunPython(create_copies, restore_is_borrowed),
+    ]
@@ -0,0 +1,29 @@
+# 與 0011 分開：PostgreSQL 不允許在同一個交易內寫入資料（尚有延遲的外鍵檢查）後再 ALTER TABLE
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0011_book_copies'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_status_borrowed_idx',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='is_borrowed',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', 'available_copies'], name='book_status_available_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__lte', models.F('total_copies'))), name='book_available_lte_total'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libmanage', '0012_remove_book_is_borrowed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='borrowrecord',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned', False)), fields=('user', 'book'), name='record_one_open_loan_per_book'),
+        ),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import User
 
+from .isbn import normalize_isbn
+
 
 # Create your models here.
 class Book(models.Model):
@@ -27,7 +29,12 @@ class Book(models.Model):
    title = models.CharField('書名', max_length=100)
    author = models.CharField('作者', max_length=50)
    isbn  = models.CharField('ISBN', max_length=17, blank=True)
-   is_borrowed = models.BooleanField(default=False)
+   # 正規化後的 ISBN（去除連字號、ISBN-10 轉 ISBN-13），由 save() 自動維護，唯一索引用於查重
+   isbn_normalized = models.CharField(max_length=17, unique=True, null=True, blank=True, editable=False)
+   # 複本數量（反正規化）：借還書時與 Copy.is_borrowed 在同一個交易內以 F() 運算式更新，
+   # 「是否有可借複本」與書籍列表只需讀取這一列，不需彙總 Copy
+   total_copies = models.PositiveIntegerField('館藏複本數', default=1)
+   available_copies = models.PositiveIntegerField('可借複本數', default=1)
    category = models.CharField(
         max_length=50,
         choices=CATEGORY_CHOICES,
@@ -41,17 +48,97 @@ class Book(models.Model):
        default='AVAILABLE', # 預設狀態為「可借閱」
        verbose_name='書籍狀態'
    )
+
+   class Meta:
+       # 支援書籍列表的伺服器端篩選與排序
+       indexes = [
+           models.Index(fields=['status', 'available_copies'], name='book_status_available_idx'),
+           models.Index(fields=['category', 'title'], name='book_category_title_idx'),
+           models.Index(fields=['title'], name='book_title_idx'),
+           models.Index(fields=['author'], name='book_author_idx'),
+       ]
+       constraints = [
+           models.CheckConstraint(
+               condition=models.Q(available_copies__lte=models.F('total_copies')),
+               name='book_available_lte_total',
+           ),
+       ]
+
+   # 由 inventory 維護的計數欄位
+   INVENTORY_FIELDS = frozenset({'total_copies', 'available_copies'})
+
+   def save(self, *args, **kwargs):
+       self.isbn_normalized = normalize_isbn(self.isbn)
+       update_fields = kwargs.get('update_fields')
+       if update_fields is not None and 'isbn' in update_fields:
+           kwargs['update_fields'] = {*update_fields, 'isbn_normalized'}
+       if not self._state.adding:
+           if kwargs.get('update_fields') is None:
+               # 複本計數只由 inventory 以條件式 UPDATE / F() 維護；儲存（可能已過時的）實例時不寫回，
+               # 避免覆蓋其他請求同時完成的借還書。延遲載入的欄位與 Model.save() 相同，不寫入
+               skipped = self.INVENTORY_FIELDS | self.get_deferred_fields()
+               kwargs['update_fields'] = [
+                   field.name for field in self._meta.concrete_fields
+                   if not field.primary_key and field.name not in skipped
+               ]
+           super().save(*args, **kwargs)
+           return
+       # 新書依 total_copies 建立複本（loaddata 不經過 save()，複本由資料檔提供）
+       self.available_copies = self.total_copies
+       with transaction.atomic(using=kwargs.get('using')):
+           super().save(*args, **kwargs)
+           Copy.objects.using(self._state.db).bulk_create([Copy(book=self) for _ in range(self.total_copies)])
+
+   @property
+   def is_borrowed(self):
+       # 相容舊欄位：所有複本都已借出
+       return self.available_copies == 0
+
    def __str__(self):
        return self.title
    
     
+class Copy(models.Model):
+    """
+    書籍的一個實體複本。同一本書的多個複本共用一筆 Book，借閱紀錄記錄借出的是哪一個複本。
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    barcode = models.CharField('館藏條碼', max_length=32, unique=True, null=True, blank=True)
+    is_borrowed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # 借書時找同一本書尚未借出的複本
+            models.Index(fields=['book', 'is_borrowed'], name='copy_book_borrowed_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.book.title} #{self.barcode or self.id}'
+
+
 class BorrowRecord(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # 移除複本時保留借閱紀錄
+    copy = models.ForeignKey(Copy, on_delete=models.SET_NULL, null=True, blank=True, related_name='records')
     borrow_date = models.DateField(auto_now_add=True)
     due_date = models.DateField()
     return_date = models.DateField(null=True, blank=True)
     returned = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # 用戶首頁查詢未歸還 / 全部借閱紀錄
+            models.Index(fields=['user', 'returned', 'borrow_date'], name='record_user_returned_date_idx'),
+        ]
+        constraints = [
+            # 同一用戶同一本書只能有一筆未歸還紀錄（借書 API 也會先檢查，這裡由資料庫保證）
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(returned=False),
+                name='record_one_open_loan_per_book',
+            ),
+        ]
     
     def __str__(self):
         return f'{self.user.username} borrowed {self.book.title}' 
@@ -0,0 +1,40 @@
+"""
+SQLite 寫入鎖重試。
+
+SQLite 同一時間只允許一個寫入交易。settings 以 WAL、BEGIN IMMEDIATE 與 busy timeout 讓寫入排隊等待，
+等待超過 timeout 仍拿不到鎖時會拋出 "database is locked"；retry_on_locked 以指數退避重新執行整個 view。
+view 內的 transaction 已回滾，重新執行是安全的；已在外層交易中（例如 ATOMIC_REQUESTS、測試）時不重試。
+view 若以 except Exception 包住寫入，須先讓 OperationalError 往外拋出。
+"""
+import functools
+import random
+import time
+
+from django.db import OperationalError, connection
+
+LOCKED_RETRY_ATTEMPTS = 4
+LOCKED_RETRY_BASE_DELAY = 0.05
+
+
+def is_locked_error(error):
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_locked(view=None, attempts=LOCKED_RETRY_ATTEMPTS, base_delay=LOCKED_RETRY_BASE_DELAY):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return view(request, *args, **kwargs)
+                except OperationalError as e:
+                    if not is_locked_error(e) or attempt == attempts - 1 or connection.in_atomic_block:
+                        raise
+                # 加入隨機成分，避免同時失敗的請求再次同時重試
+                time.sleep(base_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
@@ -0,0 +1,108 @@
+"""
+唯讀副本路由。
+
+設定 DATABASE_REPLICA_URL 時 settings 會加入 READ_REPLICA_DATABASE（'replica'）資料庫。
+只有以 replica_reads 標記的 GET view（書籍列表、用戶首頁、匯出）會從副本讀取，其餘查詢與所有寫入都在主資料庫。
+用戶寫入成功後 READ_REPLICA_PIN_SECONDS 秒內，該用戶的請求固定讀主資料庫（read-your-writes），
+避免剛借書就在首頁看不到借閱紀錄；副本的複寫延遲須小於這個秒數。
+
+每個請求的狀態由 middleware.ReadReplicaMiddleware 放在 contextvar 中，
+串流回應在 view 回傳後才查詢資料庫，因此狀態保留到 request_finished 才關閉。
+存入快取的資料（用戶首頁、館藏快照）一律從主資料庫讀取；從副本讀出的書籍列表不附 ETag。
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadState:
+    """
+    單一請求的讀取路由：use_replica 為 True 時讀取查詢送往副本。
+    """
+    def __init__(self):
+        self.use_replica = False
+
+
+_read_state = ContextVar('libmanage_read_state', default=None)
+
+
+def replica_reads(view):
+    """
+    標記 view 的讀取查詢可以送往副本（與 csrf_exempt 相同，以函式屬性標記）。
+    """
+    view.replica_reads = True
+    return view
+
+
+def replica_alias():
+    alias = settings.READ_REPLICA_DATABASE
+    return alias if alias and alias != DEFAULT_DB_ALIAS else None
+
+
+def pin_cache_key(user_id):
+    return f'replica_pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_cache_key(user_id), True, settings.READ_REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(user_id):
+    await cache.aset(pin_cache_key(user_id), True, settings.READ_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_cache_key(user_id)) is not None
+
+
+def begin_request():
+    state = ReadState()
+    _read_state.set(state)
+    return state
+
+
+def current_state():
+    return _read_state.get()
+
+
+def reading_replica():
+    """
+    目前請求的讀取查詢是否送往副本。副本可能落後主資料庫，讀到的結果不可存入快取或以目前的館藏版本號標記。
+    """
+    state = _read_state.get()
+    return state is not None and state.use_replica and replica_alias() is not None
+
+
+def end_request(**kwargs):
+    state = _read_state.get()
+    if state is not None:
+        state.use_replica = False
+
+
+request_finished.connect(end_request, dispatch_uid='libmanage_replica_end_request')
+
+
+class ReadReplicaRouter:
+    """
+    讀取：目前請求允許時送往副本，否則主資料庫。寫入與遷移一律在主資料庫。
+    """
+    def db_for_read(self, model, **hints):
+        state = _read_state.get()
+        if state is not None and state.use_replica:
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本與主資料庫內容相同
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != replica_alias()
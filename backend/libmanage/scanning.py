@@ -0,0 +1,107 @@
+"""
+條碼 / QR Code 影像辨識。
+
+- 解碼（cv2.imdecode + pyzbar）佔用 CPU 且會持有 GIL，交給有上限的行程池執行，
+  圖片再大再慢也不會卡住 event loop 或 request worker；超過 settings.SCAN_TIMEOUT 秒回傳逾時。
+- 排隊中的工作最多為行程數的 PENDING_PER_WORKER 倍，超過時立即回報忙碌（503），不會無限堆積。
+- 行程池在第一次辨識時才建立：gunicorn preload 時 master 不會建立子行程，每個 worker 各有自己的行程池。
+- settings.SCAN_WORKERS = 0 時在目前的 thread 內直接解碼（測試、單機開發用）。
+- 子行程以 spawn 啟動，只匯入本模組與 OpenCV / pyzbar，不載入 Django 的 models。
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+from django.conf import settings
+from pyzbar.pyzbar import decode as pyzbar_decode
+
+# 每個解碼行程最多排隊的工作數
+PENDING_PER_WORKER = 4
+
+
+class ScannerBusy(Exception):
+    """
+    排隊中的解碼工作已達上限，或行程池異常終止。
+    """
+
+
+def decode_image(data):
+    """
+    解碼圖片中的所有條碼，回傳 [{type, data, rect, polygon}]；圖片格式無法辨識時拋出 ValueError。
+    在子行程中執行，參數與回傳值只使用可 pickle 的基本型別。
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError('無法解碼圖像')
+    codes = []
+    for obj in pyzbar_decode(image):
+        # 一維條碼的 polygon 是掃描線上的所有點，只回傳外框的凸包
+        hull = cv2.convexHull(np.array([(p.x, p.y) for p in obj.polygon], dtype=np.int32))
+        codes.append({
+            'type': obj.type,
+            'data': obj.data.decode('utf-8', errors='replace'),
+            'rect': {'x': obj.rect.left, 'y': obj.rect.top, 'width': obj.rect.width, 'height': obj.rect.height},
+            'polygon': hull.reshape(-1, 2).tolist(),
+        })
+    return codes
+
+
+_pool = None
+_pending = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pending
+    with _pool_lock:
+        if _pool is None:
+            workers = settings.SCAN_WORKERS
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pending = threading.BoundedSemaphore(workers * PENDING_PER_WORKER)
+        return _pool, _pending
+
+
+def _discard_pool(pool):
+    # 子行程異常終止（例如 zbar 崩潰）後行程池無法再使用，下次辨識時重新建立
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def adecode_image(data):
+    """
+    在行程池中解碼圖片。排隊已滿或行程池損壞時拋出 ScannerBusy，
+    超過 settings.SCAN_TIMEOUT 秒拋出 TimeoutError（工作仍會在子行程中完成，期間佔用排隊名額）。
+    """
+    if not settings.SCAN_WORKERS:
+        return decode_image(data)
+    pool, pending = _get_pool()
+    if not pending.acquire(blocking=False):
+        raise ScannerBusy('辨識工作已滿')
+    try:
+        future = pool.submit(decode_image, data)
+    except BrokenProcessPool:
+        pending.release()
+        _discard_pool(pool)
+        raise ScannerBusy('辨識行程異常終止')
+    # 工作真正結束（或排隊中被取消）時才釋放名額
+    future.add_done_callback(lambda f: pending.release())
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), settings.SCAN_TIMEOUT)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise ScannerBusy('辨識行程異常終止')
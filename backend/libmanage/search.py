@@ -0,0 +1,193 @@
+"""
+書籍全文檢索（書名 / 作者 / ISBN）。
+
+- SQLite：FTS5 虛擬表 libmanage_book_fts，rowid 即書籍 id，以 bm25 排名。
+- PostgreSQL：libmanage_book_fts 一般表，document 為 tsvector 並建立 GIN 索引，以 ts_rank 排名。
+- 其他資料庫：退回 icontains 查詢。
+
+中文等 CJK 文字沒有空白分詞，因此寫入索引前先自行切成單字與二字詞 (bigram)，
+查詢時以相同規則切詞，兩個資料庫共用同一套分詞結果。
+索引由 signals.py 在 Book 儲存 / 刪除時同步；queryset.update() 不會觸發 signal，
+大量更新後請執行 `python manage.py rebuild_search_index`。
+"""
+import re
+
+from django.db import connections, transaction
+
+SEARCH_TABLE = 'libmanage_book_fts'
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+# ISBN 等數字之間的連字號不視為分隔符號
+DIGIT_HYPHEN_RE = re.compile(r'(?<=[0-9])-(?=[0-9Xx])')
+SPLIT_RE = re.compile(r'[\W_]+')
+
+
+def split_words(text):
+    """
+    回傳 (詞, 是否為 CJK) 的串列。
+    """
+    text = DIGIT_HYPHEN_RE.sub('', text or '')
+    text = CJK_RE.sub(lambda m: f' {m.group()} ', text)
+    words = []
+    for word in SPLIT_RE.split(text):
+        if word:
+            words.append((word.lower(), bool(CJK_RE.fullmatch(word))))
+    return words
+
+
+def cjk_bigrams(word):
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def index_terms(text):
+    """
+    寫入索引用的詞：CJK 連續字串拆成單字與 bigram，其他詞轉小寫。
+    """
+    terms = []
+    for word, is_cjk in split_words(text):
+        if is_cjk:
+            terms.extend(word)
+            terms.extend(cjk_bigrams(word))
+        else:
+            terms.append(word)
+    return ' '.join(terms)
+
+
+def query_terms(text):
+    """
+    查詢用的詞，回傳 (詞, 是否前綴比對)。CJK 單字直接比對單字，兩字以上以 bigram 交集比對。
+    """
+    terms = []
+    for word, is_cjk in split_words(text):
+        if not is_cjk:
+            terms.append((word, True))
+        elif len(word) == 1:
+            terms.append((word, False))
+        else:
+            terms.extend((gram, False) for gram in cjk_bigrams(word))
+    return terms
+
+
+def book_documents(book):
+    return index_terms(book.title), index_terms(book.author), index_terms(book.isbn)
+
+
+def create_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                f"USING fts5(title, author, isbn, tokenize='unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                f"(book_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx "
+                f"ON {SEARCH_TABLE} USING GIN (document)"
+            )
+
+
+def drop_index(connection):
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def _upsert_sql(connection):
+    if connection.vendor == 'sqlite':
+        return f"INSERT INTO {SEARCH_TABLE} (rowid, title, author, isbn) VALUES (%s, %s, %s, %s)"
+    return (
+        f"INSERT INTO {SEARCH_TABLE} (book_id, document) VALUES (%s, "
+        f"setweight(to_tsvector('simple', %s), 'A') || "
+        f"setweight(to_tsvector('simple', %s), 'B') || "
+        f"setweight(to_tsvector('simple', %s), 'C')) "
+        f"ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+
+
+def index_books(books, using='default'):
+    """
+    將書籍寫入（或覆寫）檢索索引。
+    """
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    rows = [(book.id, *book_documents(book)) for book in books]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # FTS5 沒有 ON CONFLICT，先刪除再寫入
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(_upsert_sql(connection), rows)
+
+
+def remove_book(book_id, using='default'):
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    key = 'rowid' if connection.vendor == 'sqlite' else 'book_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = %s", [book_id])
+
+
+def rebuild_index(book_model, using='default', batch_size=2000):
+    """
+    清空並以目前所有書籍重建索引，回傳寫入筆數。
+    """
+    connection = connections[using]
+    count = 0
+    with transaction.atomic(using=using):
+        drop_index(connection)
+        create_index(connection)
+        batch = []
+        books = book_model._default_manager.using(using).only('id', 'title', 'author', 'isbn')
+        for book in books.iterator(chunk_size=batch_size):
+            batch.append(book)
+            if len(batch) >= batch_size:
+                index_books(batch, using=using)
+                count += len(batch)
+                batch = []
+        index_books(batch, using=using)
+        count += len(batch)
+    return count
+
+
+def search_book_ids(query, limit=SEARCH_DEFAULT_LIMIT, using='default'):
+    """
+    依相關度由高到低回傳書籍 id；不支援全文檢索的資料庫回傳 None，由呼叫端改用 icontains。
+    """
+    connection = connections[using]
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(
+            '"{}"{}'.format(term.replace('"', '""'), '*' if prefix else '')
+            for term, prefix in terms
+        )
+        sql = (
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0) LIMIT %s"
+        )
+    elif connection.vendor == 'postgresql':
+        match = ' & '.join(
+            "'{}'{}".format(term.replace("'", "''"), ':*' if prefix else '')
+            for term, prefix in terms
+        )
+        sql = (
+            f"SELECT book_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) AS query "
+            f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s"
+        )
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, search
+from .models import Book, BorrowRecord
+
+
+# 書籍異動時同步全文檢索索引
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, using, raw=False, **kwargs):
+    if raw: # loaddata 時不處理
+        return
+    search.index_books([instance], using=using)
+
+@receiver(post_delete, sender=Book)
+def remove_book_on_delete(sender, instance, using, **kwargs):
+    search.remove_book(instance.id, using=using)
+
+# 書籍新增、修改、刪除時遞增館藏版本號並清除 ISBN 快取，讓書籍列表快照與 ETag 失效
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalogue_on_book_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    caching.books_changed([instance.id], [instance.isbn_normalized])
+
+# 書名改變時，曾借閱此書的用戶首頁快取需清除
+@receiver(post_save, sender=Book)
+def invalidate_dashboards_on_book_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and 'title' not in update_fields:
+        return
+    user_ids = BorrowRecord.objects.filter(book_id=instance.id).values_list('user_id', flat=True).distinct()
+    caching.invalidate_dashboards(list(user_ids))
+
+# 借閱、歸還、刪除紀錄時清除該用戶的首頁快取
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_delete, sender=BorrowRecord)
+def invalidate_dashboard_on_record_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    caching.invalidate_dashboards([instance.user_id])
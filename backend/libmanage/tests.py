@@ -1,7 +1,857 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from . import caching, inventory, routers, scanning, throttle, tokens
+from .middleware import ReadReplicaMiddleware
+from .retry import retry_on_locked
+from .isbn import normalize_isbn
+from .models import Book, BorrowRecord, Copy, User
+from .views import book_list_api, borrow_book_api, export_api, filter_books, user_home_api
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {tokens.issue_token(user.id, user.username)}'}
+
+EAN13_L = ('0001101', '0011001', '0010011', '0111101', '0100011', '0110001', '0101111', '0111011', '0110111', '0001011')
+EAN13_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG', 'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+def ean13_png(digits, module=3, height=80):
+    """
+    產生 EAN-13 條碼的 PNG（含左右靜區），供條碼辨識測試使用。
+    """
+    import cv2
+    import numpy as np
+    right = [''.join('1' if bit == '0' else '0' for bit in code) for code in EAN13_L]
+    left = ''.join(
+        EAN13_L[int(d)] if parity == 'L' else right[int(d)][::-1]
+        for d, parity in zip(digits[1:7], EAN13_PARITY[int(digits[0])])
+    )
+    bits = '0' * 10 + '101' + left + '01010' + ''.join(right[int(d)] for d in digits[7:]) + '101' + '0' * 10
+    row = np.array([0 if bit == '1' else 255 for bit in bits], dtype=np.uint8).repeat(module)
+    image = np.pad(np.tile(row, (height, 1)), ((20, 20), (0, 0)), constant_values=255)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
 class SimpleTest(TestCase):
     def test_homepage(self):
         response = self.client.get(reverse('home'))
         self.assertEqual(response.status_code, 200)
+
+
+class BookListApiTest(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'978000000000{i}')
+
+    def test_full_list_is_default(self):
+        response = self.client.get(reverse('api_book_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['books']), 5)
+
+    def test_keyset_pagination(self):
+        response = self.client.get(reverse('api_book_list'), {'page_size': 2})
+        data = response.json()
+        self.assertEqual(len(data['books']), 2)
+        seen = [book['id'] for book in data['books']]
+        while data['next_cursor']:
+            data = self.client.get(reverse('api_book_list'), {'page_size': 2, 'cursor': data['next_cursor']}).json()
+            seen += [book['id'] for book in data['books']]
+        self.assertEqual(seen, sorted(Book.objects.values_list('id', flat=True)))
+
+    def test_invalid_page_size(self):
+        response = self.client.get(reverse('api_book_list'), {'page_size': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(reverse('api_book_list'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], [f'Book {i}' for i in range(5)])
+
+    def test_filters(self):
+        Book.objects.create(title='Python 入門', author='Guido', isbn='9781111111111', category='COMPUTER')
+        Book.objects.filter(title='Book 0').update(available_copies=0)
+        data = self.client.get(reverse('api_book_list'), {'category': 'COMPUTER'}).json()
+        self.assertEqual([book['title'] for book in data['books']], ['Python 入門'])
+        Book.objects.filter(title='Book 1').update(status='UNDER_REPAIR')
+        data = self.client.get(reverse('api_book_list'), {'available': 'false'}).json()
+        self.assertEqual([book['title'] for book in data['books']], ['Book 0', 'Book 1'])
+        data = self.client.get(reverse('api_book_list'), {'title': 'Book', 'available': 'true'}).json()
+        self.assertEqual(len(data['books']), 3)
+        data = self.client.get(reverse('api_book_list'), {'title': 'book'}).json()
+        self.assertEqual(data['books'], [])
+        data = self.client.get(reverse('api_book_list'), {'author': 'Gui'}).json()
+        self.assertEqual([book['title'] for book in data['books']], ['Python 入門'])
+
+    def test_prefix_filter_uses_index(self):
+        queryset = filter_books(Book.objects.all(), {'title': 'Book'})
+        plan = ' '.join(str(row) for row in queryset.explain().splitlines())
+        if connection.vendor == 'sqlite':
+            self.assertIn('book_title_idx', plan)
+
+    def test_sorted_pagination(self):
+        seen = []
+        params = {'page_size': 2, 'sort': '-title'}
+        while True:
+            data = self.client.get(reverse('api_book_list'), params).json()
+            seen += [book['title'] for book in data['books']]
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, [f'Book {i}' for i in reversed(range(5))])
+
+    def test_invalid_sort(self):
+        response = self.client.get(reverse('api_book_list'), {'sort': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookSearchApiTest(TestCase):
+    def setUp(self):
+        Book.objects.create(title='React 思維進化', author='周晃安', isbn='978-626-333-769-5', category='COMPUTER')
+        Book.objects.create(title='深入淺出 Python', author='Paul Barry', isbn='9789865021986', category='COMPUTER')
+        Book.objects.create(title='台灣歷史', author='周婉窈', isbn='9789863230000', category='HISTORY')
+
+    def search(self, query):
+        response = self.client.get(reverse('api_book_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [book['title'] for book in response.json()['books']]
+
+    def test_prefix_and_cjk(self):
+        self.assertEqual(self.search('pyth'), ['深入淺出 Python'])
+        self.assertEqual(self.search('思維'), ['React 思維進化'])
+        self.assertEqual(sorted(self.search('周')), ['React 思維進化', '台灣歷史'])
+
+    def test_isbn_with_or_without_hyphens(self):
+        self.assertEqual(self.search('9786263337695'), ['React 思維進化'])
+        self.assertEqual(self.search('978-986-502'), ['深入淺出 Python'])
+
+    def test_index_follows_updates_and_deletes(self):
+        book = Book.objects.get(title='台灣歷史')
+        book.title = '世界歷史'
+        book.save()
+        self.assertEqual(self.search('台灣'), [])
+        self.assertEqual(self.search('世界'), ['世界歷史'])
+        book.delete()
+        self.assertEqual(self.search('歷史'), [])
+
+
+class BookIsbnTest(TestCase):
+    def test_normalize_isbn(self):
+        self.assertEqual(normalize_isbn('978-626-333-769-5'), '9786263337695')
+        self.assertEqual(normalize_isbn('0-306-40615-2'), '9780306406157')
+        self.assertIsNone(normalize_isbn(' - '))
+
+    def test_create_rejects_duplicate_isbn(self):
+        url = reverse('api_book_create')
+        payload = {'title': 'Book', 'author': 'Author', 'isbn': '0-306-40615-2'}
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        payload['isbn'] = '978-0-306-40615-7'
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_update_rejects_isbn_of_other_book(self):
+        Book.objects.create(title='A', author='X', isbn='9786263337695')
+        book = Book.objects.create(title='B', author='Y', isbn='9789865021986')
+        payload = {'title': 'B', 'author': 'Y', 'isbn': '978-626-333-769-5', 'category': 'OTHER', 'status': 'AVAILABLE'}
+        response = self.client.post(reverse('api_book_update', args=[book.id]), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        payload['isbn'] = '978-986-502-198-6'
+        response = self.client.post(reverse('api_book_update', args=[book.id]), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+class BookBulkImportTest(TestCase):
+    def test_csv_upload(self):
+        Book.objects.create(title='Existing', author='X', isbn='9786263337695')
+        content = (
+            'title,author,isbn,category\n'
+            'A,Alice,978-986-502-198-6,COMPUTER\n'
+            'B,Bob,978-626-333-769-5,\n'
+            ',Nobody,9789863230000,\n'
+            'C,Carol,9789865021986,\n'
+            'D,Dave,0-306-40615-2,HISTORY\n'
+        )
+        upload = SimpleUploadedFile('books.csv', content.encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('api_book_bulk_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3, 4])
+        self.assertEqual(Book.objects.get(title='D').isbn_normalized, '9780306406157')
+
+    def test_jsonl_body_is_searchable(self):
+        content = '{"title": "資料結構", "author": "王小明", "isbn": "9789863230000"}\nnot json\n'
+        response = self.client.post(reverse('api_book_bulk_import'), content, content_type='application/x-ndjson')
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual(data['errors'], [{'row': 2, 'message': '無效的 JSON'}])
+        response = self.client.get(reverse('api_book_search'), {'q': '結構'})
+        self.assertEqual([book['title'] for book in response.json()['books']], ['資料結構'])
+
+    def test_body_larger_than_upload_memory_limit(self):
+        # 請求內容逐塊讀取，不受 DATA_UPLOAD_MAX_MEMORY_SIZE（預設 2.5 MB）限制
+        content = 'title,author,isbn\n' + '\n' * (3 * 1024 * 1024) + 'A,Alice,9789865021986\n'
+        response = self.client.post(reverse('api_book_bulk_import'), content, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+
+
+class ExportApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.staff = User.objects.create(username='librarian', is_staff=True)
+        book = Book.objects.create(title='台灣歷史', author='周婉窈', isbn='9789863230000')
+        old = BorrowRecord.objects.create(user=self.user, book=book, due_date=datetime.date(2025, 3, 1),
+                                          returned=True, return_date=datetime.date(2025, 2, 1))
+        BorrowRecord.objects.filter(id=old.id).update(borrow_date=datetime.date(2025, 1, 1))
+        BorrowRecord.objects.create(user=self.user, book=book, due_date=datetime.date(2025, 8, 1))
+
+    def export(self, table, params=None, user=None):
+        return self.client.get(reverse('api_export', args=[table]), params or {}, **auth_header(user or self.staff))
+
+    def test_requires_staff(self):
+        self.assertEqual(self.client.get(reverse('api_export', args=['borrow_records'])).status_code, 401)
+        self.assertEqual(self.export('borrow_records', user=self.user).status_code, 403)
+        User.objects.filter(id=self.staff.id).update(is_active=False)
+        self.assertEqual(self.export('borrow_records').status_code, 403)
+
+    def test_books_csv(self):
+        response = self.export('books')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual([row['title'] for row in rows], ['台灣歷史'])
+
+    def test_borrow_records_jsonl_date_filter(self):
+        response = self.export('borrow_records', {
+            'format': 'jsonl', 'date_from': '2024-12-01', 'date_to': '2025-02-01',
+        })
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual((record['username'], record['borrow_date']), ('reader', '2025-01-01'))
+
+    def test_invalid_table(self):
+        response = self.export('users')
+        self.assertEqual(response.status_code, 400)
+
+
+class BorrowBookApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(title='台灣歷史', author='周婉窈', isbn='9789863230000')
+
+    def borrow(self, payload=None, **extra):
+        return self.client.post(reverse('api_borrow_book', args=[self.book.id]), payload or {}, content_type='application/json', **extra)
+
+    def test_borrow_once(self):
+        self.assertEqual(self.borrow(**auth_header(self.user)).status_code, 200)
+        self.assertEqual(self.borrow(**auth_header(self.user)).status_code, 409)
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_borrowed)
+        self.assertEqual(BorrowRecord.objects.filter(book=self.book, returned=False).count(), 1)
+
+    def test_user_id_param_requires_token(self):
+        self.assertEqual(self.borrow({'user_id': self.user.id}).status_code, 401)
+        self.assertEqual(self.borrow({'user_id': self.user.id}, HTTP_AUTHORIZATION='Bearer forged').status_code, 401)
+        self.assertFalse(BorrowRecord.objects.exists())
+
+    def test_token_user_overrides_body(self):
+        other = User.objects.create(username='other')
+        self.assertEqual(self.borrow({'user_id': other.id}, **auth_header(self.user)).status_code, 200)
+        self.assertEqual(BorrowRecord.objects.get().user_id, self.user.id)
+
+    @override_settings(API_ALLOW_USER_ID_PARAM=True)
+    def test_legacy_unknown_user_rolls_back(self):
+        self.assertEqual(self.borrow({'user_id': 999}).status_code, 404)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.is_borrowed)
+        self.assertFalse(BorrowRecord.objects.exists())
+
+    def test_unavailable_status(self):
+        Book.objects.filter(id=self.book.id).update(status='UNDER_REPAIR')
+        self.assertEqual(self.borrow(**auth_header(self.user)).status_code, 409)
+
+
+class BatchBorrowReturnApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'978000000000{i}') for i in range(3)
+        ]
+        Book.objects.filter(id=self.books[2].id).update(status='LOST')
+
+    def post(self, name, payload):
+        return self.client.post(reverse(name), payload, content_type='application/json', **auth_header(self.user))
+
+    def test_batch_borrow_then_return(self):
+        response = self.post('api_batch_borrow', {
+            'book_ids': [self.books[0].id, str(self.books[2].id), 999],
+            'isbns': ['978-0000000001'],
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['borrowed'], 2)
+        self.assertEqual([result['success'] for result in data['results']], [True, False, False, True])
+        self.assertEqual(Book.objects.filter(available_copies=0).count(), 2)
+
+        response = self.post('api_batch_return', {'book_ids': [self.books[0].id], 'isbns': ['978-0000000001', '9780000000002']})
+        self.assertEqual(response.json()['returned'], 2)
+        self.assertEqual([result['success'] for result in response.json()['results']], [True, True, False])
+        self.assertFalse(Book.objects.filter(available_copies=0).exists())
+        self.assertFalse(BorrowRecord.objects.filter(returned=False).exists())
+
+    def test_batch_limit(self):
+        response = self.post('api_batch_borrow', {'book_ids': list(range(51))})
+        self.assertEqual(response.status_code, 400)
+
+
+class CopyInventoryTest(TestCase):
+    """
+    多複本書籍：借還書以 available_copies 計數判斷，並記錄借出的複本。
+    """
+    def setUp(self):
+        self.users = [User.objects.create(username=f'reader{i}') for i in range(3)]
+        response = self.client.post(reverse('api_book_create'), {
+            'title': '微積分', 'author': 'Stewart', 'isbn': '9789863230000', 'copies': 2,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.book = Book.objects.get(id=response.json()['book_id'])
+
+    def borrow(self, user):
+        return self.client.post(reverse('api_borrow_book', args=[self.book.id]), {}, content_type='application/json', **auth_header(user))
+
+    def counts(self):
+        self.book.refresh_from_db()
+        return self.book.total_copies, self.book.available_copies
+
+    def test_borrow_each_copy_once(self):
+        self.assertEqual(self.book.copies.count(), 2)
+        self.assertEqual(self.borrow(self.users[0]).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_book_list'), {'available': 'true'}).json()['books'][0]['available_copies'], 1)
+        self.assertEqual(self.borrow(self.users[1]).status_code, 200)
+        self.assertEqual(self.borrow(self.users[2]).status_code, 409)
+        self.assertEqual(self.counts(), (2, 0))
+        self.assertEqual(len(set(BorrowRecord.objects.values_list('copy_id', flat=True))), 2)
+        self.assertFalse(self.book.copies.filter(is_borrowed=False).exists())
+        book = self.client.get(reverse('api_book_detail', args=[self.book.id])).json()['book']
+        self.assertTrue(book['is_borrowed'])
+
+    def test_same_user_cannot_hold_two_copies(self):
+        self.assertEqual(self.borrow(self.users[0]).status_code, 200)
+        response = self.borrow(self.users[0])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['message'], '您已借閱此書且尚未歸還')
+        response = self.client.post(reverse('api_batch_borrow'), {'book_ids': [self.book.id]},
+                                    content_type='application/json', **auth_header(self.users[0]))
+        self.assertEqual(response.json()['borrowed'], 0)
+        self.assertEqual(response.json()['results'][0]['message'], '您已借閱此書且尚未歸還')
+        self.assertEqual(self.counts(), (2, 1))
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+
+    def test_open_loan_checked_after_copy_is_locked(self):
+        # 模擬同一用戶的另一個借書請求在等待書籍列鎖期間先提交了借閱紀錄
+        checkout = inventory.checkout_copies
+
+        def racing_checkout(book_ids):
+            BorrowRecord.objects.create(user=self.users[0], book=self.book, due_date=datetime.date.today())
+            return checkout(book_ids)
+
+        with mock.patch('libmanage.inventory.checkout_copies', racing_checkout), \
+                mock.patch('libmanage.views.borrow_integrity_error') as integrity_error:
+            response = self.borrow(self.users[0])
+        self.assertEqual(response.status_code, 409)
+        # 由 view 的檢查擋下，而不是靠唯一約束
+        integrity_error.assert_not_called()
+        self.assertEqual(self.counts(), (2, 2))
+        self.assertFalse(BorrowRecord.objects.exists())
+
+    def test_database_rejects_second_open_loan(self):
+        BorrowRecord.objects.create(user=self.users[0], book=self.book, due_date=datetime.date.today())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BorrowRecord.objects.create(user=self.users[0], book=self.book, due_date=datetime.date.today())
+        BorrowRecord.objects.update(returned=True)
+        BorrowRecord.objects.create(user=self.users[0], book=self.book, due_date=datetime.date.today())
+
+    def test_return_frees_copy_once(self):
+        self.borrow(self.users[0])
+        record = BorrowRecord.objects.get()
+        self.assertEqual(self.client.post(reverse('api_return_book', args=[record.id])).status_code, 200)
+        self.assertEqual(self.client.post(reverse('api_return_book', args=[record.id])).status_code, 409)
+        self.assertEqual(self.counts(), (2, 2))
+        self.assertFalse(self.book.copies.filter(is_borrowed=True).exists())
+
+    def test_add_copies_and_refuse_delete_while_borrowed(self):
+        self.borrow(self.users[0])
+        response = self.client.put(reverse('api_book_update', args=[self.book.id]), {
+            'title': '微積分', 'author': 'Stewart', 'isbn': '9789863230000', 'category': 'SCIENCE',
+            'status': 'AVAILABLE', 'add_copies': 3,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(), (5, 4))
+        self.assertEqual(self.book.copies.count(), 5)
+        self.assertEqual(self.client.delete(reverse('api_book_delete', args=[self.book.id])).status_code, 409)
+
+    def test_saving_stale_instance_keeps_counts(self):
+        stale = Book.objects.get(id=self.book.id)
+        self.assertEqual(self.borrow(self.users[0]).status_code, 200)
+        stale.title = '微積分（第九版）'
+        stale.save()
+        self.assertEqual(self.counts(), (2, 1))
+        self.assertEqual(self.book.title, '微積分（第九版）')
+
+    def test_import_copies_column(self):
+        content = 'title,author,isbn,copies\nA,Alice,9789865021986,3\nB,Bob,9780306406157,0\n'
+        response = self.client.post(reverse('api_book_bulk_import'), content, content_type='text/csv')
+        self.assertEqual(response.json()['created'], 1)
+        book = Book.objects.get(title='A')
+        self.assertEqual((book.total_copies, book.available_copies, book.copies.count()), (3, 3, 3))
+
+
+class UserHomeApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        books = [
+            Book.objects.create(title='台灣歷史', author='周婉窈', isbn='9789863230000'),
+            Book.objects.create(title='台灣史論', author='周婉窈', isbn='9789863230001'),
+        ]
+        today = datetime.date.today()
+        for i in range(5):
+            book = books[i % 2]
+            record = BorrowRecord.objects.create(
+                user=self.user, book=book, copy=book.copies.first(), due_date=today - datetime.timedelta(days=1),
+                returned=i < 3, return_date=today if i < 3 else None,
+            )
+            BorrowRecord.objects.filter(id=record.id).update(borrow_date=today - datetime.timedelta(days=30 - i))
+        # 最後兩筆未歸還，兩本書的複本都已借出
+        Copy.objects.update(is_borrowed=True)
+        Book.objects.update(available_copies=0)
+
+    def get(self, params=None, **extra):
+        return self.client.get(reverse('api_user_home'), params or {}, **auth_header(self.user), **extra)
+
+    def test_overdue_computed_in_query(self):
+        data = self.get().json()
+        self.assertEqual(data['username'], 'reader')
+        self.assertEqual(len(data['all_records']), 5)
+        self.assertTrue(all(record['is_overdue'] for record in data['all_records']))
+        self.assertEqual(len(data['borrowed_books']), 2)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_paginated_history_keeps_open_loans(self):
+        data = self.get({'page_size': 2}).json()
+        self.assertEqual(len(data['all_records']), 2)
+        self.assertEqual(len(data['borrowed_books']), 2)
+        seen = [record['id'] for record in data['all_records']]
+        while data['next_cursor']:
+            data = self.get({'page_size': 2, 'cursor': data['next_cursor']}).json()
+            seen += [record['id'] for record in data['all_records']]
+        self.assertEqual(seen, list(BorrowRecord.objects.order_by('-borrow_date').values_list('id', flat=True)))
+
+    def test_requires_token(self):
+        response = self.client.get(reverse('api_user_home'), {'user_id': self.user.id})
+        self.assertEqual(response.status_code, 401)
+
+    def test_dashboard_cache_and_etag(self):
+        response = self.get()
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        record = BorrowRecord.objects.filter(returned=False).first()
+        response = self.client.post(reverse('api_return_book', args=[record.id]))
+        self.assertEqual(response.status_code, 200)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['borrowed_books']), 1)
+
+    def test_invalidation_during_query_discards_late_write(self):
+        aset_dashboard = caching.aset_dashboard
+
+        async def late_write(user_id, generation, body):
+            # 其他請求的借還書在這個請求查詢之後、寫入快取之前提交
+            await sync_to_async(caching.invalidate_dashboards)([user_id])
+            return await aset_dashboard(user_id, generation, body)
+
+        with mock.patch('libmanage.caching.aset_dashboard', late_write):
+            self.get()
+        with CaptureQueriesContext(connection) as queries:
+            self.get()
+        self.assertTrue(queries.captured_queries)
+
+
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(title='台灣歷史', author='周婉窈', isbn='9789863230000')
+
+    def test_full_list_etag_and_gzip(self):
+        url = reverse('api_book_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['books'][0]['title'], '台灣歷史')
+
+        user = User.objects.create(username='reader')
+        self.client.post(reverse('api_borrow_book', args=[self.book.id]), {}, content_type='application/json', **auth_header(user))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['books'][0]['is_borrowed'])
+
+    def test_detail_not_modified(self):
+        url = reverse('api_book_detail', args=[self.book.id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book.title = '世界歷史'
+        self.book.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class IsbnCacheTest(TestCase):
+    def setUp(self):
+        caching.isbn_cache.clear()
+        self.book = Book.objects.create(title='React 思維進化', author='周晃安', isbn='978-626-333-769-5')
+
+    def test_lookup_is_cached_and_invalidated(self):
+        url = reverse('api_book_detail', args=['9786263337695'])
+        self.assertEqual(self.client.get(url).json()['book']['id'], self.book.id)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/books/isbn/978-626-333-769-5/')
+        self.assertEqual(response.json()['book']['title'], 'React 思維進化')
+
+        self.book.title = 'React 思維進化（第二版）'
+        self.book.save()
+        response = self.client.get('/api/books/isbn/9786263337695/')
+        self.assertEqual(response.json()['book']['title'], 'React 思維進化（第二版）')
+
+    def test_other_worker_change_is_a_miss(self):
+        url = reverse('api_book_detail', args=['9786263337695'])
+        etag = self.client.get(url)['ETag']
+        stale = caching.isbn_cache.stats()['stale']
+        # 其他 worker 修改書籍：共用的館藏版本號遞增，但本行程的 ISBN 快取沒有被清除
+        Book.objects.filter(id=self.book.id).update(title='React 思維進化（第二版）')
+        caching.bump_catalogue_version()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['book']['title'], 'React 思維進化（第二版）')
+        self.assertEqual(caching.isbn_cache.stats()['stale'], stale + 1)
+
+    def test_lru_eviction_and_ttl(self):
+        now = [0.0]
+        lru = caching.IsbnCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        for i in range(3):
+            lru.set(str(i), {'id': i})
+        self.assertIsNone(lru.get('0'))
+        self.assertEqual(lru.get('2'), {'id': 2})
+        now[0] = 11
+        self.assertIsNone(lru.get('2'))
+        stats = lru.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['expirations']), (1, 2, 1, 1))
+
+
+class LoginApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader', password=make_password('secret-pass', hasher='pbkdf2_sha256'))
+
+    def login(self, password, **extra):
+        return self.client.post(reverse('api_login'), {'username': 'reader', 'password': password}, content_type='application/json', **extra)
+
+    def test_login_upgrades_legacy_hash(self):
+        response = self.login('secret-pass')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertEqual(self.login('secret-pass').status_code, 200)
+
+    def test_account_is_throttled_before_hashing(self):
+        for _ in range(5):
+            self.assertEqual(self.login('wrong').status_code, 401)
+        with mock.patch('libmanage.hashers.verify_password') as verify:
+            response = self.login('secret-pass', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        verify.assert_not_called()
+
+    def test_concurrent_attempts_share_one_counter(self):
+        # 同時送出的嘗試以 cache.incr 原子計數，不會讀到同一個舊值而全部通過
+        limit = throttle.RateLimit('test', 5, 60)
+        barrier = threading.Barrier(20)
+
+        def attempt():
+            barrier.wait()
+            return limit.consume('reader', now=30)
+
+        with ThreadPoolExecutor(20) as pool:
+            results = list(pool.map(lambda _: attempt(), range(20)))
+        self.assertEqual(results.count(0), 5)
+        self.assertEqual(max(results), 30)
+        self.assertEqual(limit.consume('reader', now=60), 0)
+
+    @override_settings(TRUST_X_REAL_IP=False)
+    def test_forged_real_ip_is_ignored(self):
+        # 不存在的帳號不計算雜湊；每次換帳號與 X-Real-IP，仍以 REMOTE_ADDR 計數
+        for i in range(throttle.LOGIN_IP_LIMIT[0] + 1):
+            response = self.client.post(reverse('api_login'), {'username': f'nobody{i}', 'password': 'x'},
+                                        content_type='application/json', HTTP_X_REAL_IP=f'10.0.0.{i}')
+        self.assertEqual(response.status_code, 429)
+
+    def test_register_hashes_with_preferred_hasher(self):
+        response = self.client.post(reverse('api_register'), {'username': 'new', 'password': 'another-pass'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='new').password.startswith('scrypt$'))
+
+    def test_token_revoked_on_logout_and_password_change(self):
+        token = self.login('secret-pass').json()['token']
+        header = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.assertEqual(self.client.get(reverse('api_user_home'), **header).status_code, 200)
+        self.client.post(reverse('api_logout'), **header)
+        self.assertEqual(self.client.get(reverse('api_user_home'), **header).status_code, 401)
+
+        header = auth_header(self.user)
+        response = self.client.post(reverse('api_update_profile'), {'new_password': 'new-pass'}, content_type='application/json', **header)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_user_home'), **header).status_code, 401)
+        new_header = {'HTTP_AUTHORIZATION': f'Bearer {response.json()["token"]}'}
+        self.assertEqual(self.client.get(reverse('api_user_home'), **new_header).status_code, 200)
+
+
+class AsyncApiTest(TestCase):
+    """
+    以 AsyncClient（ASGIRequest）呼叫 async view，串流回應須為 async iterator。
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        for i in range(3):
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'978000000000{i}')
+
+    async def read_stream(self, response):
+        self.assertTrue(response.is_async)
+        return b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+
+    async def test_book_list_and_ndjson(self):
+        response = await self.async_client.get(reverse('api_book_list'), {'page_size': 2})
+        self.assertEqual(len(response.json()['books']), 2)
+        response = await self.async_client.get(reverse('api_book_list'), {'format': 'ndjson'})
+        lines = (await self.read_stream(response)).splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Book 0', 'Book 1', 'Book 2'])
+
+    async def test_export_streams_chunks(self):
+        staff = await User.objects.acreate(username='librarian', is_staff=True)
+        response = await self.async_client.get(reverse('api_export', args=['books']), {'format': 'jsonl'},
+                                               headers={'Authorization': auth_header(staff)['HTTP_AUTHORIZATION']})
+        self.assertEqual(len((await self.read_stream(response)).splitlines()), 3)
+
+    async def test_detail_isbn_and_user_home(self):
+        response = await self.async_client.get(reverse('api_book_detail', args=['978-0000000001']))
+        self.assertEqual(response.json()['book']['title'], 'Book 1')
+        response = await self.async_client.get('/api/books/isbn/9780000000002/')
+        self.assertEqual(response.json()['book']['title'], 'Book 2')
+
+        url = reverse('api_user_home')
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        response = await self.async_client.get(url, headers={'Authorization': auth_header(self.user)['HTTP_AUTHORIZATION']})
+        self.assertEqual(response.json()['username'], 'reader')
+
+
+@override_settings(READ_REPLICA_DATABASE='replica')
+class ReplicaCacheTest(TestCase):
+    """
+    副本可能落後主資料庫：存入快取或附 ETag 的回應只由主資料庫的資料產生。
+    測試環境沒有 replica 連線，送往副本的查詢會失敗。
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        Book.objects.create(title='Book', author='Author', isbn='9780000000000')
+
+    async def test_cached_dashboard_reads_primary(self):
+        response = await self.async_client.get(reverse('api_user_home'), headers={'Authorization': auth_header(self.user)['HTTP_AUTHORIZATION']})
+        self.assertEqual(response.status_code, 200)
+        generation = await caching.aget_dashboard_generation(self.user.id)
+        self.assertIsNotNone(await caching.aget_dashboard(self.user.id, generation))
+
+    @mock.patch('libmanage.views.build_book_list_response')
+    async def test_replica_book_list_has_no_etag(self, build):
+        build.return_value = JsonResponse({'books': []})
+        response = await self.async_client.get(reverse('api_book_list'), {'category': 'SCIENCE'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        with override_settings(READ_REPLICA_DATABASE=None):
+            response = await self.async_client.get(reverse('api_book_list'), {'category': 'SCIENCE'})
+        self.assertIn('ETag', response)
+
+
+@override_settings(SCAN_WORKERS=0)
+class ScanCodeApiTest(TestCase):
+    def setUp(self):
+        caching.isbn_cache.clear()
+        self.book = Book.objects.create(title='React 思維進化', author='周晃安', isbn='978-626-333-769-5')
+        self.url = reverse('api_scan_code')
+
+    def test_upload_and_raw_body_resolve_isbn(self):
+        image = ean13_png('9786263337695')
+        upload = SimpleUploadedFile('cover.png', image, content_type='image/png')
+        for response in (
+            self.client.post(self.url, {'file': upload}),
+            self.client.post(self.url, image, content_type='image/png'),
+        ):
+            self.assertEqual(response.status_code, 200)
+            code, = response.json()['codes']
+            self.assertEqual((code['type'], code['data']), ('EAN13', '9786263337695'))
+            self.assertEqual(code['book']['id'], self.book.id)
+            self.assertGreater(code['rect']['width'], 0)
+
+    def test_non_isbn_codes_are_not_resolved(self):
+        with mock.patch('libmanage.scanning.decode_image', return_value=[
+            {'type': 'EAN13', 'data': '4710088412345', 'rect': {}, 'polygon': []},
+            {'type': 'QRCODE', 'data': 'ISBN: 9786263337695', 'rect': {}, 'polygon': []},
+        ]):
+            response = self.client.post(self.url, b'image', content_type='image/jpeg')
+        self.assertEqual([code['book'] for code in response.json()['codes']], [None, None])
+
+    def test_rejects_bad_images(self):
+        self.assertEqual(self.client.post(self.url, b'', content_type='image/png').status_code, 400)
+        self.assertEqual(self.client.post(self.url, b'not an image', content_type='image/png').status_code, 400)
+        with override_settings(SCAN_MAX_UPLOAD_BYTES=10):
+            self.assertEqual(self.client.post(self.url, b'x' * 11, content_type='image/png').status_code, 413)
+
+    def test_busy_and_timeout(self):
+        with mock.patch('libmanage.scanning.adecode_image', side_effect=scanning.ScannerBusy):
+            response = self.client.post(self.url, b'image', content_type='image/png')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        with mock.patch('libmanage.scanning.adecode_image', side_effect=TimeoutError):
+            response = self.client.post(self.url, b'image', content_type='image/png')
+        self.assertEqual(response.status_code, 504)
+
+
+@override_settings(SCAN_WORKERS=1)
+class ScanningPoolTest(SimpleTestCase):
+    """
+    以真正的子行程解碼。
+    """
+    def tearDown(self):
+        scanning.shutdown()
+
+    def test_decodes_in_worker_process(self):
+        codes = asyncio.run(scanning.adecode_image(ean13_png('9780306406157')))
+        self.assertEqual([code['data'] for code in codes], ['9780306406157'])
+        with self.assertRaises(ValueError):
+            asyncio.run(scanning.adecode_image(b'not an image'))
+
+    def test_full_queue_is_rejected(self):
+        with mock.patch.object(scanning, 'PENDING_PER_WORKER', 0):
+            with self.assertRaises(scanning.ScannerBusy):
+                asyncio.run(scanning.adecode_image(ean13_png('9780306406157')))
+
+
+class RetryOnLockedTest(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().post('/')
+
+    def flaky_view(self, errors):
+        calls = []
+
+        @retry_on_locked
+        def view(request):
+            calls.append(request)
+            if len(calls) <= errors:
+                raise OperationalError('database is locked')
+            return 'ok'
+        return view, calls
+
+    @mock.patch('libmanage.retry.time.sleep')
+    def test_retries_locked_writes(self, sleep):
+        view, calls = self.flaky_view(errors=2)
+        self.assertEqual(view(self.request), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @mock.patch('libmanage.retry.time.sleep')
+    def test_gives_up_after_attempts(self, sleep):
+        view, calls = self.flaky_view(errors=10)
+        with self.assertRaises(OperationalError):
+            view(self.request)
+        self.assertEqual(len(calls), 4)
+
+
+@override_settings(READ_REPLICA_DATABASE='replica', READ_REPLICA_PIN_SECONDS=5)
+class ReadReplicaRoutingTest(SimpleTestCase):
+    """
+    以 RequestFactory 直接呼叫 ReadReplicaMiddleware，view 回傳路由器選擇的讀取資料庫。
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = routers.ReadReplicaRouter()
+        self.middleware = ReadReplicaMiddleware(self.dispatch)
+        self.principal = tokens.Principal(7, 'reader', 'jti', 0)
+
+    def dispatch(self, request):
+        self.middleware.process_view(request, self.view, (), {})
+        return JsonResponse({'db': self.router.db_for_read(Book) or 'default'}, status=self.status)
+
+    def call(self, method, view, principal=None, status=200):
+        self.view, self.status = view, status
+        request = getattr(self.factory, method)('/')
+        request.principal = principal
+        return json.loads(self.middleware(request).content)['db']
+
+    def tearDown(self):
+        routers.end_request()
+
+    def test_only_marked_views_read_from_replica(self):
+        self.assertEqual(self.call('get', book_list_api), 'replica')
+        self.assertEqual(self.call('get', user_home_api, self.principal), 'replica')
+        self.assertEqual(self.call('get', export_api), 'replica')
+        self.assertEqual(self.call('post', borrow_book_api, self.principal), 'default')
+        self.assertEqual(self.router.db_for_write(BorrowRecord), 'default')
+
+    def test_pins_user_to_primary_after_write(self):
+        self.call('post', borrow_book_api, self.principal)
+        self.assertEqual(self.call('get', user_home_api, self.principal), 'default')
+        other = tokens.Principal(8, 'other', 'jti', 0)
+        self.assertEqual(self.call('get', user_home_api, other), 'replica')
+
+        cache.delete(routers.pin_cache_key(self.principal.id)) # 模擬固定期間結束
+        self.assertEqual(self.call('get', user_home_api, self.principal), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        self.call('post', borrow_book_api, self.principal, status=400)
+        self.assertEqual(self.call('get', user_home_api, self.principal), 'replica')
+
+    def test_request_finished_returns_to_primary(self):
+        self.call('get', book_list_api)
+        self.assertEqual(self.router.db_for_read(Book), 'replica')
+        routers.end_request()
+        self.assertIsNone(self.router.db_for_read(Book))
+
+    @override_settings(READ_REPLICA_DATABASE=None)
+    def test_without_replica_everything_reads_primary(self):
+        self.assertEqual(self.call('get', book_list_api), 'default')
@@ -0,0 +1,72 @@
+"""
+登入 / 註冊限流，在計算密碼雜湊之前擋下暴力嘗試。
+固定時間窗計數：每個時間窗一個 cache 鍵，以 cache.add + cache.incr 原子遞增，
+同時送出的請求不會讀到同一個舊值而全部通過。
+狀態存在 Django cache（多個 worker 時請設定 REDIS_URL 共用）。
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# (時間窗內允許的次數, 時間窗秒數)
+LOGIN_ACCOUNT_LIMIT = (5, 60)
+LOGIN_IP_LIMIT = (30, 30)
+REGISTER_IP_LIMIT = (10, 60)
+
+
+class RateLimit:
+    def __init__(self, name, limit, period):
+        self.name = name
+        self.limit = limit
+        self.period = period
+
+    def cache_key(self, key, window):
+        digest = hashlib.md5(str(key).encode('utf-8')).hexdigest()
+        return f'throttle:{self.name}:{digest}:{window}'
+
+    def consume(self, key, now=None):
+        """
+        計入一次請求；允許時回傳 0，否則回傳到下一個時間窗需等待的秒數。
+        """
+        now = time.time() if now is None else now
+        window = int(now // self.period)
+        cache_key = self.cache_key(key, window)
+        # 時間窗結束後鍵自動過期
+        timeout = self.period + 1
+        cache.add(cache_key, 0, timeout)
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            # add 與 incr 之間鍵剛好過期
+            cache.add(cache_key, 1, timeout)
+            count = 1
+        if count > self.limit:
+            return (window + 1) * self.period - now
+        return 0
+
+
+login_account_limit = RateLimit('login-account', *LOGIN_ACCOUNT_LIMIT)
+login_ip_limit = RateLimit('login-ip', *LOGIN_IP_LIMIT)
+register_ip_limit = RateLimit('register-ip', *REGISTER_IP_LIMIT)
+
+
+def client_ip(request):
+    # 經由 nginx 轉發時 REMOTE_ADDR 是 nginx，改用 nginx 設定的 X-Real-IP（須設定 TRUST_X_REAL_IP）
+    if getattr(settings, 'TRUST_X_REAL_IP', False):
+        real_ip = request.META.get('HTTP_X_REAL_IP')
+        if real_ip:
+            return real_ip
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_login(account, ip):
+    """
+    回傳需等待的秒數，0 表示允許。IP 與帳號各自計數。
+    """
+    return max(login_ip_limit.consume(ip), login_account_limit.consume(account.lower()))
+
+
+def check_register(ip):
+    return register_ip_limit.consume(ip)
@@ -0,0 +1,73 @@
+"""
+無狀態的 API bearer token。
+
+login_api 以 django.core.signing（HMAC，金鑰為 SECRET_KEY）簽發含用戶 id、名稱與簽發時間的 token，
+TokenAuthenticationMiddleware 驗證簽章與期限後，在 request.principal 放入 Principal，
+之後的 API 不需查詢 users 資料表，也不再相信請求中自帶的 user_id。
+登出或修改密碼時在 cache 記錄撤銷資訊，驗證時以一次 get_many 檢查。
+"""
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+TOKEN_SALT = 'libmanage.api-token'
+
+Principal = namedtuple('Principal', ['id', 'username', 'token_id', 'issued_at'])
+
+
+def max_age():
+    return settings.API_TOKEN_MAX_AGE
+
+
+def issue_token(user_id, username):
+    # iat 以奈秒計，修改密碼時撤銷舊 token 後立即簽發的新 token 不會落在同一個時間點
+    payload = {'uid': user_id, 'name': username, 'iat': time.time_ns(), 'jti': uuid.uuid4().hex}
+    return signing.dumps(payload, salt=TOKEN_SALT)
+
+
+def decode_token(token):
+    """
+    驗證簽章與期限，回傳 Principal；不合法或過期時回傳 None。
+    """
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=max_age())
+        return Principal(int(payload['uid']), payload['name'], payload['jti'], int(payload['iat']))
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def revoked_token_key(token_id):
+    return f'token:revoked:{token_id}'
+
+
+def user_tokens_valid_after_key(user_id):
+    return f'token:valid_after:{user_id}'
+
+
+def revocation_keys(principal):
+    return [revoked_token_key(principal.token_id), user_tokens_valid_after_key(principal.id)]
+
+
+def is_revoked(principal, values):
+    """
+    values 為以 revocation_keys() 從 cache 取得的結果。
+    """
+    if values.get(revoked_token_key(principal.token_id)):
+        return True
+    valid_after = values.get(user_tokens_valid_after_key(principal.id))
+    return valid_after is not None and principal.issued_at < valid_after
+
+
+def revoke_token(principal):
+    remaining = principal.issued_at // 10 ** 9 + max_age() - int(time.time())
+    if remaining > 0:
+        cache.set(revoked_token_key(principal.token_id), True, remaining)
+
+
+def revoke_user_tokens(user_id):
+    # 在此之前簽發的 token 全部失效
+    cache.set(user_tokens_valid_after_key(user_id), time.time_ns(), max_age())
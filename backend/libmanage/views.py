@@ -1,30 +1,142 @@
+import io
 import json
-import base64
-from datetime import datetime, timedelta 
+import math
+from datetime import timedelta
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections, transaction
+from django.db.models import BooleanField, Case, F, Q, Value, When
 from django.shortcuts import get_object_or_404
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.http import Http404 # 新增 Http404 引入，用於 book_detail_api
-
-# 圖像處理和條碼辨識庫
-import cv2
-import numpy as np
-from pyzbar.pyzbar import decode as pyzbar_decode, ZBarSymbol
 
+from . import caching, exporter, hashers, importer, inventory, scanning, search, throttle, tokens
+from .isbn import is_isbn13, normalize_isbn
+from .retry import retry_on_locked
+from .routers import reading_replica, replica_reads
 from .models import Book, User, BorrowRecord 
 
+# 書籍列表回傳的欄位（另以 book_values() 附上相容舊版的 is_borrowed）
+BOOK_LIST_FIELDS = ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies', 'category', 'status')
+BOOK_LIST_DEFAULT_PAGE_SIZE = 100
+BOOK_LIST_MAX_PAGE_SIZE = 1000
+BOOK_STREAM_CHUNK_SIZE = 2000
+# 書籍列表允許的排序欄位（前綴 '-' 表示遞減）
+BOOK_LIST_SORT_FIELDS = ('id', 'title', 'author', 'category', 'status')
+# 前綴範圍條件的上界：最大的 Unicode code point
+PREFIX_UPPER_BOUND = '\U0010ffff'
+# 用戶首頁借閱歷史的欄位與分頁大小
+USER_HISTORY_FIELDS = ('id', 'book_title', 'borrow_date', 'due_date', 'return_date', 'returned', 'is_overdue')
+USER_HISTORY_DEFAULT_PAGE_SIZE = 100
+USER_HISTORY_MAX_PAGE_SIZE = 500
+# 用戶首頁每次都須向伺服器驗證 ETag
+DASHBOARD_CACHE_CONTROL = 'private, no-cache'
+# 館藏資料以版本號 ETag 驗證，未變更時回傳 304
+CATALOGUE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+# 借閱天數
+BORROW_DAYS = 60
+# 批次借還書單次最多處理的項目數
+BATCH_MAX_ITEMS = 50
+
+def book_values(queryset):
+    return queryset.values(*BOOK_LIST_FIELDS, is_borrowed=inventory.IS_BORROWED)
+
 # 錯誤處理輔助函數
 def error_response(message, status=400):
     return JsonResponse({'message': message}, status=status)
 
+def parse_positive_int(value, default, maximum=None):
+    """
+    將查詢參數轉為正整數，空值回傳 default，非正整數則拋出 ValueError。
+    """
+    if value in (None, ''):
+        return default
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    if maximum is not None:
+        number = min(number, maximum)
+    return number
+
+def request_user(request, user_id=None):
+    """
+    回傳 (用戶 id, 用戶名稱, 錯誤回應)。
+    帶有效 token 時直接使用 request.principal，不查詢 users 資料表，並忽略請求中的 user_id；
+    只有 settings.API_ALLOW_USER_ID_PARAM 開啟時才接受 user_id（舊版前端過渡用）。
+    """
+    principal = getattr(request, 'principal', None)
+    if principal is not None:
+        return principal.id, principal.username, None
+    if not settings.API_ALLOW_USER_ID_PARAM or not user_id:
+        return None, None, error_response('請先登入', status=401)
+    try:
+        user_id = parse_positive_int(user_id, None)
+    except (TypeError, ValueError):
+        return None, None, error_response('user_id 必須為正整數', status=400)
+    username = User.objects.filter(id=user_id).values_list('username', flat=True).first()
+    if username is None:
+        return None, None, error_response('用戶不存在', status=404)
+    return user_id, username, None
+
+def staff_required_error(request):
+    """
+    需要館員權限的 API：token 對應的用戶為啟用中的 is_staff 時回傳 None，否則回傳錯誤回應。
+    不接受 user_id 參數；權限從主資料庫讀取，撤銷權限後立即生效。
+    """
+    principal = getattr(request, 'principal', None)
+    if principal is None:
+        return error_response('請先登入', status=401)
+    if not User.objects.using(DEFAULT_DB_ALIAS).filter(id=principal.id, is_staff=True, is_active=True).exists():
+        return error_response('需要館員權限', status=403)
+    return None
+
+async def arequest_user(request, user_id=None):
+    # token 驗證不需 I/O，只有 user_id 參數的舊版流程才需要查詢資料庫
+    principal = getattr(request, 'principal', None)
+    if principal is not None:
+        return principal.id, principal.username, None
+    return await sync_to_async(request_user)(request, user_id)
+
+async def aiterate(iterator):
+    """
+    在 ASGI 下逐塊消費同步產生器（每塊經由 sync_to_async 取得），
+    避免 StreamingHttpResponse 先把整個同步產生器讀進記憶體。
+    """
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next)(iterator, done)
+        if chunk is done:
+            break
+        yield chunk
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+def streaming_response(request, content, content_type):
+    """
+    ASGI 下 StreamingHttpResponse 需要 async iterator，WSGI（runserver、gunicorn sync worker）需要同步 iterator，
+    否則 Django 會先把整個回應讀進記憶體。content 為同步產生器。
+    """
+    if is_asgi(request):
+        content = aiterate(content)
+    return StreamingHttpResponse(content, content_type=content_type)
+
 # API Views for React Frontend
+def throttled_response(retry_after):
+    response = error_response('嘗試次數過多，請稍後再試', status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+# 登入與註冊需計算密碼雜湊，以 async view 將計算交給 hashers 的 thread pool
 @csrf_exempt
 @require_http_methods(["POST"])
-def login_api(request):
+async def login_api(request):
     try:
         data = json.loads(request.body)
         account = data.get('username')
@@ -35,20 +147,26 @@ def login_api(request):
     if not account or not password:
         return error_response('請輸入帳號與密碼', status=400)
 
-    user = User.objects.filter(username=account).first()
+    # 在計算任何雜湊之前先限流
+    retry_after = await sync_to_async(throttle.check_login)(account, throttle.client_ip(request))
+    if retry_after:
+        return throttled_response(retry_after)
+
+    user = await User.objects.filter(username=account).afirst()
 
-    if not user or not check_password(password, user.password):
+    if not user or not await hashers.acheck_user_password(user, password):
         return error_response('帳號或密碼錯誤', status=401)
     
     return JsonResponse({
         'message': f"歡迎：{user.username}",
         'user_id': user.id,
-        'username': user.username
+        'username': user.username,
+        'token': tokens.issue_token(user.id, user.username)
     }, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def register_api(request):
+async def register_api(request):
     try:
         data = json.loads(request.body)
         account = data.get('username')
@@ -59,13 +177,17 @@ def register_api(request):
     if not account or not password:
         return error_response('請輸入帳號與密碼', status=400)
 
-    if User.objects.filter(username=account).exists():
+    retry_after = await sync_to_async(throttle.check_register)(throttle.client_ip(request))
+    if retry_after:
+        return throttled_response(retry_after)
+
+    if await User.objects.filter(username=account).aexists():
         return error_response('帳號已存在', status=409)
 
     try:
-        new_user = User.objects.create(
+        new_user = await User.objects.acreate(
             username=account,
-            password=make_password(password)
+            password=await hashers.amake_password(password)
         )
         return JsonResponse({
             'message': '註冊成功', 
@@ -77,94 +199,328 @@ def register_api(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def logout_api(request):
+    if request.principal is not None:
+        tokens.revoke_token(request.principal)
     return JsonResponse({'message': '已登出'}, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"]) # 這裡可以使用 PUT
+@retry_on_locked
 def update_profile_api(request):
     try:
         data = json.loads(request.body)
-        user_id = data.get('user_id')
         new_password = data.get('new_password')
     except json.JSONDecodeError:
         return error_response('Invalid JSON', status=400)
 
-    if not user_id:
-        return error_response('User ID is required', status=401)
+    user_id, username, error = request_user(request, data.get('user_id'))
+    if error:
+        return error
     
     if not new_password:
         return error_response('新密碼不可為空', status=400)
 
     try:
-        user = get_object_or_404(User, id=user_id)
-        
-        user.password = make_password(new_password)
-        user.save()
-
-        return JsonResponse({'message': '密碼更新成功！'}, status=200)
-    except User.DoesNotExist:
-        return error_response('用戶不存在', status=404)
+        if not User.objects.filter(id=user_id).update(password=make_password(new_password)):
+            return error_response('用戶不存在', status=404)
+        # 修改密碼後，先前簽發的 token 全部失效，回傳新的 token 讓目前的裝置保持登入
+        tokens.revoke_user_tokens(user_id)
+        return JsonResponse({
+            'message': '密碼更新成功！',
+            'token': tokens.issue_token(user_id, username)
+        }, status=200)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'更新個人資料失敗：{str(e)}', status=500)
 
+def borrow_records_with_overdue(user_id, current_date):
+    """
+    用戶借閱紀錄，is_overdue 在 SQL 中計算：
+    已歸還者看歸還日是否晚於到期日，未歸還者看今天是否已超過到期日。
+    """
+    return BorrowRecord.objects.filter(user_id=user_id).annotate(
+        book_title=F('book__title'),
+        is_overdue=Case(
+            When(returned=True, return_date__gt=F('due_date'), then=Value(True)),
+            When(returned=False, due_date__lt=current_date, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    ).values(*USER_HISTORY_FIELDS)
+
+def open_loan_data(record):
+    return {
+        'id': record['id'],
+        'book_title': record['book_title'],
+        'borrow_date': record['borrow_date'],
+        'due_date': record['due_date'],
+        'is_overdue': record['is_overdue'],
+    }
+
+@replica_reads
 @require_http_methods(["GET"]) # 使用 GET 請求 
-def user_home_api(request):
-    user_id = request.GET.get('user_id')
-    if not user_id:
-        return error_response('User ID is required', status=401)
-    
+async def user_home_api(request):
+    """
+    用戶首頁：目前借閱中的書與借閱歷史。
+    歷史依借閱日期遞減分頁：?page_size=N（預設 USER_HISTORY_DEFAULT_PAGE_SIZE）&cursor=紀錄ID。
+    未帶分頁參數的預設頁面會快取並附 ETag，借閱紀錄異動時清除；now 為快取產生的時間。
+    用戶由 token 決定，快取命中時不需任何資料庫查詢；會被快取的預設頁面一律從主資料庫讀取。
+    """
+    user_id, username, error = await arequest_user(request, request.GET.get('user_id'))
+    if error:
+        return error
+
+    use_cache = 'cursor' not in request.GET and 'page_size' not in request.GET
+    if use_cache:
+        # 查詢前取得世代號，查詢期間借閱紀錄異動時，這次建立的快取屬於舊世代
+        generation = await caching.aget_dashboard_generation(user_id)
+        cached = await caching.aget_dashboard(user_id, generation)
+        if cached is not None:
+            etag, body = cached
+            return caching.cached_json_response(request, body, etag, DASHBOARD_CACHE_CONTROL)
     try:
-        user = get_object_or_404(User, id=user_id)
-    except User.DoesNotExist:
-        return error_response('User not found', status=404)
+        page_size = parse_positive_int(request.GET.get('page_size'), USER_HISTORY_DEFAULT_PAGE_SIZE, USER_HISTORY_MAX_PAGE_SIZE)
+        cursor = parse_positive_int(request.GET.get('cursor'), None)
+    except ValueError:
+        return error_response('page_size 與 cursor 必須為正整數', status=400)
     
     current_date = timezone.now().date() # 獲取當前日期
+    records = borrow_records_with_overdue(user_id, current_date)
+    if use_cache:
+        # 預設頁面會快取到下一次借閱異動，從主資料庫讀取，避免副本延遲時把舊資料存進快取
+        records = records.using(DEFAULT_DB_ALIAS)
 
-    borrowed_books_records = BorrowRecord.objects.filter(user=user, returned=False).select_related('book')
-    borrowed_books_data = [{
-        'id': record.id,
-        'book_title': record.book.title,
-        'borrow_date': record.borrow_date.isoformat(),
-        'due_date': record.due_date.isoformat(),
-        'is_overdue': current_date > record.due_date
-    } for record in borrowed_books_records]
-
-    all_records_queryset = BorrowRecord.objects.filter(user=user).order_by('-borrow_date').select_related('book')
-    all_records_data = []
-    for record in all_records_queryset:
-        is_overdue = False
-        if record.returned:
-            if record.return_date and record.return_date > record.due_date: # 確保日期比較
-                is_overdue = True
-        else:
-            if current_date > record.due_date:
-                is_overdue = True
-
-        all_records_data.append({
-            'id': record.id,
-            'book_title': record.book.title,
-            'borrow_date': record.borrow_date.isoformat(),
-            'due_date': record.due_date.isoformat(),
-            'return_date': record.return_date.isoformat() if record.return_date else None,
-            'returned': record.returned,
-            'is_overdue': is_overdue
-        })
-    
-    return JsonResponse({
-        'username': user.username,
+    history = records.order_by('-borrow_date', '-id')
+    if cursor is not None:
+        anchor = await BorrowRecord.objects.filter(id=cursor, user_id=user_id).values_list('borrow_date', flat=True).afirst()
+        if anchor is None:
+            return error_response('無效的 cursor', status=400)
+        history = history.filter(Q(borrow_date__lt=anchor) | Q(borrow_date=anchor, id__lt=cursor))
+
+    # 多取一筆用來判斷是否還有下一頁
+    all_records_data = [record async for record in history[:page_size + 1]]
+    has_more = len(all_records_data) > page_size
+    all_records_data = all_records_data[:page_size]
+
+    if cursor is None and not has_more:
+        # 第一頁已涵蓋全部歷史，借閱中的書直接由同一批結果取得
+        borrowed_books_data = [open_loan_data(record) for record in all_records_data if not record['returned']]
+    else:
+        # 未歸還的紀錄走 (user_id, returned, borrow_date) 索引
+        borrowed_books_data = [
+            open_loan_data(record) async for record in records.filter(returned=False).order_by('-borrow_date', '-id')
+        ]
+
+    response = JsonResponse({
+        'username': username,
         'borrowed_books': borrowed_books_data,
         'all_records': all_records_data,
+        'next_cursor': all_records_data[-1]['id'] if has_more else None,
         'now': timezone.now().isoformat()
     }, status=200)
+    if use_cache:
+        etag = await caching.aset_dashboard(user_id, generation, response.content)
+        return caching.cached_json_response(request, response.content, etag, DASHBOARD_CACHE_CONTROL)
+    return response
+
+def stream_books_ndjson(books, chunk_size=BOOK_STREAM_CHUNK_SIZE):
+    # 以伺服器端游標分批讀取，每列輸出一行 JSON，記憶體用量不隨館藏數量成長
+    for book in books.iterator(chunk_size=chunk_size):
+        yield json.dumps(book, ensure_ascii=False) + '\n'
 
+async def astream_books_ndjson(books, chunk_size=BOOK_STREAM_CHUNK_SIZE):
+    async for book in books.aiterator(chunk_size=chunk_size):
+        yield json.dumps(book, ensure_ascii=False) + '\n'
+
+def parse_bool(value):
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(value)
+
+def filter_prefix(queryset, field, prefix):
+    """
+    以前綴篩選文字欄位。SQLite 的 LIKE 無法使用一般 B-tree 索引，改用範圍條件
+    （BINARY collation 依 code point 排序，範圍內恰為以 prefix 開頭的字串，大小寫有別，與 PostgreSQL 相同）；
+    PostgreSQL 的 LIKE 'abc%' 使用 0010 的 varchar_pattern_ops 索引。
+    """
+    if connections[queryset.db].vendor == 'sqlite':
+        return queryset.filter(**{f'{field}__gte': prefix, f'{field}__lt': prefix + PREFIX_UPPER_BOUND})
+    return queryset.filter(**{f'{field}__startswith': prefix})
+
+def filter_books(queryset, params):
+    """
+    依查詢參數篩選書籍：category、status、available、author、title（前綴）。
+    available=false 為 available=true 的補集（狀態不是可借閱，或所有複本都已借出）。
+    """
+    category = params.get('category')
+    if category:
+        queryset = queryset.filter(category=category)
+    status = params.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    available = parse_bool(params.get('available'))
+    if available is True:
+        queryset = inventory.borrowable(queryset)
+    elif available is False:
+        queryset = inventory.not_borrowable(queryset)
+    author = params.get('author')
+    if author:
+        queryset = filter_prefix(queryset, 'author', author)
+    title = params.get('title')
+    if title:
+        queryset = filter_prefix(queryset, 'title', title)
+    return queryset
+
+def parse_book_sort(value):
+    """
+    回傳 (欄位, 是否遞減)；不合法的欄位拋出 ValueError。
+    """
+    value = value or 'id'
+    descending = value.startswith('-')
+    field = value.lstrip('-')
+    if field not in BOOK_LIST_SORT_FIELDS:
+        raise ValueError(value)
+    return field, descending
+
+async def apply_keyset_cursor(queryset, cursor, field, descending):
+    """
+    以 (排序欄位, id) 作為鍵集游標，cursor 為上一頁最後一筆書籍的 id。
+    """
+    op = 'lt' if descending else 'gt'
+    if field == 'id':
+        return queryset.filter(**{f'id__{op}': cursor})
+    anchor = await Book.objects.filter(id=cursor).values_list(field, flat=True).afirst()
+    if anchor is None:
+        raise ValueError(cursor)
+    return queryset.filter(
+        Q(**{f'{field}__{op}': anchor}) | Q(**{field: anchor, f'id__{op}': cursor})
+    )
+
+@replica_reads
 @require_http_methods(["GET"]) # 使用 GET 請求 
-def book_list_api(request):
-    # 從資料庫中獲取所有書籍的資訊
-    books = Book.objects.all().values('id', 'title', 'author', 'isbn', 'is_borrowed', 'category', 'status')
-    return JsonResponse({'books': list(books)}, status=200)
+async def book_list_api(request):
+    """
+    書籍列表。
+    - 不帶參數：回傳全部書籍（相容既有前端）。
+    - ?category=&status=&available=&author=&title=：伺服器端篩選（author、title 為前綴比對）。
+    - ?sort=title|-title|author|...：排序，預設依 id。
+    - ?page_size=N&cursor=ID：以 (排序欄位, id) 為游標的分頁，回傳 next_cursor。
+    - ?format=ndjson：以 StreamingHttpResponse 逐行串流全部書籍。
+    ETag 由館藏版本號產生，未變更時回傳 304；不帶參數的完整列表直接回傳行程內的快照位元組。
+    從唯讀副本讀取的篩選 / 分頁結果不附 ETag。
+    """
+    version = await caching.aget_catalogue_version()
+    is_full_list = not request.GET
+    encoding = caching.choose_encoding(request) if is_full_list else None
+    etag = caching.catalogue_etag(version, encoding)
+    if caching.etag_matches(request, etag):
+        response = caching.not_modified(etag, CATALOGUE_CACHE_CONTROL)
+        if is_full_list:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+    if is_full_list:
+        body = caching.catalogue_snapshot.peek(version, encoding)
+        if body is None:
+            # 重建快照（查詢與壓縮）在 thread 中執行，不阻塞 event loop
+            body = await sync_to_async(caching.catalogue_snapshot.get)(version, encoding, build_full_book_list)
+        response = HttpResponse(body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Cache-Control'] = CATALOGUE_CACHE_CONTROL
+        return response
+
+    response = await build_book_list_response(request)
+    # 副本可能尚未複寫到目前的館藏版本，從副本讀出的結果不附 ETag，避免用戶端之後以 304 沿用舊資料
+    if response.status_code == 200 and not reading_replica():
+        response['ETag'] = etag
+        response['Cache-Control'] = CATALOGUE_CACHE_CONTROL
+    return response
+
+def build_full_book_list():
+    # 快照由所有請求共用直到下一次館藏異動，從主資料庫讀取，避免副本延遲時把舊資料存進新版本
+    books = book_values(Book.objects.using(DEFAULT_DB_ALIAS).order_by('id'))
+    return JsonResponse({'books': list(books)}).content
+
+async def build_book_list_response(request):
+    try:
+        field, descending = parse_book_sort(request.GET.get('sort'))
+        books = filter_books(Book.objects.all(), request.GET)
+    except ValueError:
+        return error_response('無效的篩選或排序參數', status=400)
+
+    if descending:
+        books = books.order_by(f'-{field}', '-id')
+    else:
+        books = books.order_by(field, 'id')
+    books = book_values(books)
+
+    if request.GET.get('format') == 'ndjson':
+        content = astream_books_ndjson(books) if is_asgi(request) else stream_books_ndjson(books)
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson; charset=utf-8')
+        response['X-Accel-Buffering'] = 'no' # 避免 nginx 緩衝整個回應
+        return response
+
+    if 'cursor' not in request.GET and 'page_size' not in request.GET:
+        return JsonResponse({'books': [book async for book in books]}, status=200)
+
+    try:
+        page_size = parse_positive_int(request.GET.get('page_size'), BOOK_LIST_DEFAULT_PAGE_SIZE, BOOK_LIST_MAX_PAGE_SIZE)
+        cursor = parse_positive_int(request.GET.get('cursor'), None)
+    except ValueError:
+        return error_response('page_size 與 cursor 必須為正整數', status=400)
+
+    if cursor is not None:
+        try:
+            books = await apply_keyset_cursor(books, cursor, field, descending)
+        except ValueError:
+            return error_response('無效的 cursor', status=400)
+
+    # 多取一筆用來判斷是否還有下一頁
+    page = [book async for book in books[:page_size + 1]]
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    return JsonResponse({
+        'books': page,
+        'next_cursor': page[-1]['id'] if has_more else None,
+        'page_size': page_size,
+    }, status=200)
+
+@require_http_methods(["GET"])
+def book_search_api(request):
+    """
+    全文檢索書名、作者與 ISBN，依相關度排序。?q=關鍵字&limit=N
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return error_response('請輸入搜尋關鍵字', status=400)
+    try:
+        limit = parse_positive_int(request.GET.get('limit'), search.SEARCH_DEFAULT_LIMIT, search.SEARCH_MAX_LIMIT)
+    except ValueError:
+        return error_response('limit 必須為正整數', status=400)
+
+    book_ids = search.search_book_ids(query, limit=limit)
+    if book_ids is None:
+        # 資料庫不支援全文檢索時退回 icontains
+        books = list(book_values(Book.objects.filter(
+            Q(title__icontains=query) | Q(author__icontains=query) | Q(isbn__icontains=query)
+        ).order_by('id'))[:limit])
+    else:
+        rows = {row['id']: row for row in book_values(Book.objects.filter(id__in=book_ids))}
+        books = [rows[book_id] for book_id in book_ids if book_id in rows]
+    return JsonResponse({'query': query, 'books': books}, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@retry_on_locked
 def book_create_api(request):
     try:
         data = json.loads(request.body)
@@ -173,30 +529,64 @@ def book_create_api(request):
         isbn = data.get('isbn')
         category = data.get('category', 'OTHER') 
         status = data.get('status', 'AVAILABLE') 
+        copies = data.get('copies', 1)
     except json.JSONDecodeError:
         return error_response('Invalid JSON', status=400)
 
     if not title or not author or not isbn:
         return error_response('請填寫所有必填欄位 (書名、作者、ISBN)', status=400)
+    copies = as_int(copies)
+    if copies is None or not 1 <= copies <= inventory.MAX_NEW_COPIES:
+        return error_response(f'複本數必須介於 1 與 {inventory.MAX_NEW_COPIES} 之間', status=400)
     
-    # 檢查 ISBN 是否重複
-    if Book.objects.filter(isbn=isbn).exists():
-        return error_response('ISBN 已存在，請確認ISBN 是否有誤。', status=409)
-
+    # ISBN 重複由 isbn_normalized 的唯一索引判斷，只需一次 INSERT（複本另以一次 bulk_create 建立）
     try:
-        new_book = Book.objects.create(title=title, author=author, isbn=isbn, category=category, status=status)
+        with transaction.atomic():
+            new_book = Book.objects.create(
+                title=title, author=author, isbn=isbn, category=category, status=status, total_copies=copies,
+            )
         return JsonResponse({'message': '書籍新增成功', 'book_id': new_book.id}, status=201)
+    except IntegrityError:
+        return error_response('ISBN 已存在，請確認ISBN 是否有誤。', status=409)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'新增失敗：{str(e)}', status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def book_bulk_import_api(request):
+    """
+    批次匯入書籍。以 multipart 上傳檔案（欄位 file），或直接以 CSV / JSONL 作為請求內容。
+    格式由 ?format=csv|jsonl|marc、檔名或 Content-Type 判斷，回傳新增筆數與每列錯誤。
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        stream = upload
+        fmt = request.GET.get('format') or importer.guess_format(upload.name, upload.content_type)
+    else:
+        # 直接從請求串流逐塊讀取，大檔案不會整個載入記憶體
+        stream = io.BufferedReader(importer.ReadableStream(request))
+        fmt = request.GET.get('format') or importer.guess_format(content_type=request.content_type)
+
+    if fmt not in importer.IMPORT_FORMATS:
+        return error_response('無法判斷匯入格式，請指定 format=csv、jsonl 或 marc', status=400)
+
+    try:
+        result = importer.import_books(importer.iter_rows(stream, fmt))
+    except (ValueError, UnicodeDecodeError) as e:
+        return error_response(f'匯入失敗：{str(e)}', status=400)
+    return JsonResponse(result, status=200)
+
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@retry_on_locked
 def book_delete_api(request, book_id):
     try:
         book = get_object_or_404(Book, id=book_id)
-        # 檢查書籍是否被借出或有其他狀態，如果被借出則不能刪除
-        if book.is_borrowed:
-            return error_response('此書已被借出，無法刪除。', status=409)
+        # 檢查書籍是否被借出或有其他狀態，任一複本借出中則不能刪除
+        if book.available_copies < book.total_copies:
+            return error_response('此書尚有複本借出中，無法刪除。', status=409)
         # 根據 status 判斷是否可刪除
         if book.status == 'DAMAGED' or book.status == 'LOST':
              # 允許刪除損壞或遺失的書籍
@@ -206,79 +596,292 @@ def book_delete_api(request, book_id):
             
         book.delete()
         return JsonResponse({'message': '書籍已成功刪除'}, status=200)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'刪除失敗：{str(e)}', status=500)
 
+def borrow_integrity_error(user_id):
+    # 外鍵約束（token 中的用戶已刪除）或每人每書一筆未歸還紀錄的唯一約束
+    if not User.objects.filter(id=user_id).exists():
+        return error_response('用戶不存在', status=404)
+    return error_response('您已借閱此書且尚未歸還', status=409)
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@retry_on_locked
 def borrow_book_api(request, book_id):
     try:
         data = json.loads(request.body)
-        user_id = data.get('user_id')
     except json.JSONDecodeError:
         return error_response('Invalid JSON', status=400)
 
-    if not user_id:
-        return error_response('User ID is required', status=401)
-    
-    user = get_object_or_404(User, id=user_id)
-    book = get_object_or_404(Book, id=book_id)
-
-    if book.is_borrowed:
-        return error_response('此書已被借出', status=409)
-    
-    # 檢查書籍狀態是否為 AVAILABLE
-    if book.status != 'AVAILABLE':
-        return error_response(f'此書狀態為 "{book.get_status_display()}"，無法借閱。', status=409)
-    
-    if BorrowRecord.objects.filter(user=user, book=book, returned=False).exists():
-        return error_response('您已借閱此書且尚未歸還', status=409)
+    user_id, _, error = request_user(request, data.get('user_id'))
+    if error:
+        return error
 
-    due_date = timezone.now() + timedelta(days=60) 
+    due_date = timezone.now() + timedelta(days=BORROW_DAYS) 
     due_date = due_date.date()
 
-    BorrowRecord.objects.create(
-        user=user, 
-        book=book, 
-        borrow_date=timezone.now(),
-        due_date=due_date
-    )
-    
-    book.is_borrowed = True
-    book.save()
-    
+    # token 中的用戶不再逐次查詢，已刪除的用戶由外鍵約束擋下
+    try:
+        with transaction.atomic():
+            # 條件式 UPDATE：只有「可借閱且仍有可借複本」的書會扣減 available_copies，
+            # 最後一個複本同時被兩台機器借閱時只有一個請求成功
+            copies = inventory.checkout_copies([book_id])
+            book = Book.objects.only('title', 'available_copies', 'status').filter(id=book_id).first()
+            if book is None:
+                return error_response('書籍不存在', status=404)
+            if copies is None:
+                transaction.set_rollback(True)
+                if book.status != 'AVAILABLE':
+                    return error_response(f'此書狀態為 "{book.get_status_display()}"，無法借閱。', status=409)
+                return error_response('此書已被借出', status=409)
+            # 同一用戶同一本書只能有一筆未歸還紀錄，即使仍有其他可借複本。
+            # 在條件式 UPDATE 鎖住書籍這一列之後才檢查，同一用戶同時送出的借書請求會看到先提交的紀錄
+            if BorrowRecord.objects.filter(user_id=user_id, book_id=book_id, returned=False).exists():
+                transaction.set_rollback(True)
+                return error_response('您已借閱此書且尚未歸還', status=409)
+            caching.books_changed([book_id])
+
+            BorrowRecord.objects.create(
+                user_id=user_id, 
+                book_id=book_id, 
+                copy_id=copies[book_id],
+                due_date=due_date
+            )
+    except IntegrityError:
+        return borrow_integrity_error(user_id)
+
     return JsonResponse({
         'message': f"{book.title} 借閱成功，歸還日期：{due_date.strftime('%Y-%m-%d')}"
     }, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@retry_on_locked
 def return_book_api(request, record_id):
     try:
-        record = get_object_or_404(BorrowRecord, id=record_id)
-        if record.returned:
+        record = get_object_or_404(BorrowRecord.objects.select_related('book'), id=record_id)
+        if record.returned or not return_records([record]):
             return error_response('此書已歸還', status=409)
-
-        record.returned = True
-        record.return_date = timezone.now()
-        record.book.is_borrowed = False
-        
-        # 歸還後將書籍狀態設為 AVAILABLE，除非原本是損壞或遺失
-        if record.book.status not in ['DAMAGED', 'LOST']: # 不修改已損壞或遺失的狀態
-             record.book.status = 'AVAILABLE'
-        
-        record.book.save()
-        record.save()
         
         return JsonResponse({'message': f"{record.book.title} 已成功歸還"}, status=200)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'歸還失敗：{str(e)}', status=500)
 
+def as_int(value):
+    # 批次請求中的 id 可能是數字或數字字串
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def batch_result(item, book=None, success=False, message=''):
+    return {
+        'item': item,
+        'book_id': book.id if book else None,
+        'title': book.title if book else None,
+        'success': success,
+        'message': message,
+    }
+
+def return_records(records):
+    """
+    歸還借閱紀錄並歸還對應的複本，回傳是否成功；任一筆已被其他請求歸還時回滾並回傳 False。
+    以條件式 UPDATE 標記紀錄，同一筆紀錄不會重複增加可借數量。
+    """
+    with transaction.atomic():
+        updated = BorrowRecord.objects.filter(id__in=[record.id for record in records], returned=False).update(
+            returned=True, return_date=timezone.localdate(),
+        )
+        if updated != len(records):
+            transaction.set_rollback(True)
+            return False
+        book_ids = inventory.checkin_copies((record.book_id, record.copy_id) for record in records)
+        # queryset.update() 不會觸發 signal
+        caching.books_changed(book_ids)
+        caching.invalidate_dashboards(record.user_id for record in records)
+    return True
+
+def load_batch_request(request, *keys):
+    """
+    解析批次請求，回傳 (data, 錯誤回應)。keys 中的欄位必須是 list，總數介於 1 與 BATCH_MAX_ITEMS 之間。
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return None, error_response('Invalid JSON', status=400)
+    if not isinstance(data, dict):
+        return None, error_response('Invalid JSON', status=400)
+    total = 0
+    for key in keys:
+        value = data.get(key) or []
+        if not isinstance(value, list):
+            return None, error_response(f'{key} 必須是陣列', status=400)
+        data[key] = value
+        total += len(value)
+    if total == 0:
+        return None, error_response(f'請提供 {" 或 ".join(keys)}', status=400)
+    if total > BATCH_MAX_ITEMS:
+        return None, error_response(f'單次最多處理 {BATCH_MAX_ITEMS} 本書', status=400)
+    return data, None
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@retry_on_locked
+def batch_borrow_api(request):
+    """
+    自助借書機一次借閱多本書。
+    {"book_ids": [1, 2], "isbns": ["978..."]}，借閱者為 token 對應的用戶。
+    全部書籍以一次查詢取得，狀態變更在同一個交易內以一次 UPDATE 與一次 bulk_create 完成，回傳每本書的結果。
+    """
+    data, error = load_batch_request(request, 'book_ids', 'isbns')
+    if error:
+        return error
+
+    user_id, _, error = request_user(request, data.get('user_id'))
+    if error:
+        return error
+
+    items = [('book_id', value) for value in data['book_ids']] + [('isbn', value) for value in data['isbns']]
+    book_ids = set()
+    isbns = set()
+    for key, value in items:
+        if key == 'book_id' and as_int(value) is not None:
+            book_ids.add(as_int(value))
+        elif key == 'isbn' and normalize_isbn(value):
+            isbns.add(normalize_isbn(value))
+
+    due_date = (timezone.now() + timedelta(days=BORROW_DAYS)).date()
+    results = []
+    to_borrow = {}
+    try:
+        with transaction.atomic():
+            books = Book.objects.select_for_update().only('id', 'title', 'isbn_normalized', 'available_copies', 'status').filter(
+                Q(id__in=book_ids) | Q(isbn_normalized__in=isbns)
+            )
+            by_id = {}
+            by_isbn = {}
+            for book in books:
+                by_id[book.id] = book
+                by_isbn[book.isbn_normalized] = book
+            # 同一用戶同一本書只能有一筆未歸還紀錄，即使仍有其他可借複本
+            borrowed = set(BorrowRecord.objects.filter(
+                user_id=user_id, book_id__in=by_id, returned=False,
+            ).values_list('book_id', flat=True))
+
+            for key, value in items:
+                if key == 'book_id':
+                    book = by_id.get(as_int(value))
+                else:
+                    book = by_isbn.get(normalize_isbn(value))
+                if book is None:
+                    results.append(batch_result(value, message='書籍不存在'))
+                elif book.id in to_borrow:
+                    results.append(batch_result(value, book, message='同一本書重複出現'))
+                elif book.id in borrowed:
+                    results.append(batch_result(value, book, message='您已借閱此書且尚未歸還'))
+                elif book.available_copies == 0:
+                    results.append(batch_result(value, book, message='此書已被借出'))
+                elif book.status != 'AVAILABLE':
+                    results.append(batch_result(value, book, message=f'此書狀態為 "{book.get_status_display()}"，無法借閱。'))
+                else:
+                    to_borrow[book.id] = book
+                    results.append(batch_result(value, book, success=True, message='借閱成功'))
+
+            if to_borrow:
+                # SQLite 不支援 select_for_update，以條件式 UPDATE 的筆數確認期間沒有其他櫃台借走最後一個複本
+                copies = inventory.checkout_copies(to_borrow)
+                if copies is None:
+                    transaction.set_rollback(True)
+                    return error_response('部分書籍正由其他櫃台處理，請重新掃描', status=409)
+                caching.books_changed(to_borrow)
+                BorrowRecord.objects.bulk_create([
+                    BorrowRecord(user_id=user_id, book_id=book_id, copy_id=copies[book_id], due_date=due_date)
+                    for book_id in to_borrow
+                ])
+                # bulk_create 不會觸發 signal
+                caching.invalidate_dashboards([user_id])
+    except IntegrityError:
+        return borrow_integrity_error(user_id)
+
+    return JsonResponse({
+        'borrowed': len(to_borrow),
+        'due_date': due_date.isoformat(),
+        'results': results,
+    }, status=200)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@retry_on_locked
+def batch_return_api(request):
+    """
+    一次歸還多本書。
+    {"record_ids": [1, 2]}、{"book_ids": [3, 4]} 或 {"isbns": ["978..."]}
+    （以書籍 id / ISBN 歸還時，歸還 token 對應用戶每本書最近一筆未歸還紀錄）。
+    """
+    data, error = load_batch_request(request, 'record_ids', 'book_ids', 'isbns')
+    if error:
+        return error
+
+    user_id = None
+    if data['book_ids'] or data['isbns']:
+        user_id, _, error = request_user(request, data.get('user_id'))
+        if error:
+            return error
+
+    record_ids = {as_int(value) for value in data['record_ids']} - {None}
+    book_ids = {as_int(value) for value in data['book_ids']} - {None}
+    isbns = {normalize_isbn(value) for value in data['isbns']} - {None}
+    book_by_isbn = {}
+    if isbns:
+        book_by_isbn = dict(Book.objects.filter(isbn_normalized__in=isbns).values_list('isbn_normalized', 'id'))
+        book_ids |= set(book_by_isbn.values())
+
+    results = []
+    to_return = {}
+    with transaction.atomic():
+        records = BorrowRecord.objects.select_for_update().select_related('book').only(
+            'id', 'user_id', 'book_id', 'copy_id', 'returned', 'borrow_date', 'book__title',
+        )
+        by_record = {}
+        if record_ids:
+            by_record = {record.id: record for record in records.filter(id__in=record_ids)}
+        by_book = {}
+        if book_ids:
+            open_records = records.filter(user_id=user_id, book_id__in=book_ids, returned=False).order_by('borrow_date', 'id')
+            # 依借閱日期遞增，後面的覆蓋前面的，保留每本書最近一筆
+            by_book = {record.book_id: record for record in open_records}
+
+        items = [(value, by_record.get(as_int(value))) for value in data['record_ids']]
+        items += [(value, by_book.get(as_int(value))) for value in data['book_ids']]
+        items += [(value, by_book.get(book_by_isbn.get(normalize_isbn(value)))) for value in data['isbns']]
+        for value, record in items:
+            if record is None:
+                results.append(batch_result(value, message='未找到未歸還的借閱紀錄'))
+            elif record.returned:
+                results.append(batch_result(value, record.book, message='此書已歸還'))
+            elif record.id in to_return:
+                results.append(batch_result(value, record.book, message='同一筆紀錄重複出現'))
+            else:
+                to_return[record.id] = record
+                results.append(batch_result(value, record.book, success=True, message='歸還成功'))
+
+        if to_return and not return_records(list(to_return.values())):
+            transaction.set_rollback(True)
+            return error_response('部分紀錄正由其他櫃台處理，請重新掃描', status=409)
+
+    return JsonResponse({'returned': len(to_return), 'results': results}, status=200)
+
 @csrf_exempt
 @require_http_methods(["PUT", "POST"])
+@retry_on_locked
 def update_book_api(request, book_id):
     """
-    更新單本書籍的所有資訊（書名、作者、ISBN、分類、狀態）。
+    更新單本書籍的所有資訊（書名、作者、ISBN、分類、狀態），add_copies 為選填的新增複本數。
     """
     try:
         book = get_object_or_404(Book, id=book_id)
@@ -292,17 +895,23 @@ def update_book_api(request, book_id):
 
         if not all([title, author, isbn, category, status]): # 檢查所有必填欄位
             return error_response('書名、作者、ISBN、分類、狀態均為必填', status=400)
-
-        # 檢查新的 ISBN 是否與其他書籍重複（除了當前正在編輯的書籍）
-        if Book.objects.filter(isbn=isbn).exclude(id=book_id).exists():
-            return error_response('此 ISBN 已被其他書籍使用，請輸入獨特的 ISBN', status=409)
+        add_copies = as_int(data.get('add_copies', 0))
+        if add_copies is None or not 0 <= add_copies <= inventory.MAX_NEW_COPIES:
+            return error_response(f'新增複本數必須介於 0 與 {inventory.MAX_NEW_COPIES} 之間', status=400)
 
         book.title = title
         book.author = author
         book.isbn = isbn
         book.category = category
         book.status = status
-        book.save()
+        # 新的 ISBN 若與其他書籍重複，由唯一索引擋下
+        try:
+            with transaction.atomic():
+                book.save(update_fields=['title', 'author', 'isbn', 'category', 'status'])
+                if add_copies:
+                    inventory.add_copies(book, add_copies)
+        except IntegrityError:
+            return error_response('此 ISBN 已被其他書籍使用，請輸入獨特的 ISBN', status=409)
 
         return JsonResponse({'message': f'書籍 "{book.title}" 更新成功！'}, status=200)
 
@@ -310,11 +919,14 @@ def update_book_api(request, book_id):
         return error_response('書籍不存在', status=404)
     except json.JSONDecodeError:
         return error_response('無效的 JSON 數據', status=400)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'更新書籍過程中發生錯誤：{str(e)}', status=500)
 
 @csrf_exempt
 @require_http_methods(["PUT"]) # 專門用於更新書籍狀態的API
+@retry_on_locked
 def update_book_status_api(request, book_id):
     """
     僅更新單本書籍的狀態。使用 PUT 請求。
@@ -333,7 +945,7 @@ def update_book_status_api(request, book_id):
             return error_response('無效的書籍狀態', status=400)
 
         book.status = new_status
-        book.save()
+        book.save(update_fields=['status'])
 
         return JsonResponse({'message': f'書籍 "{book.title}" 狀態已更新為 "{book.get_status_display()}"'}, status=200)
 
@@ -341,35 +953,56 @@ def update_book_status_api(request, book_id):
         return error_response('書籍不存在', status=404)
     except json.JSONDecodeError:
         return error_response('無效的 JSON 數據', status=400)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'更新書籍狀態時發生錯誤：{str(e)}', status=500)
 
 
+async def alookup_book_by_isbn(isbn, version=None):
+    """
+    以正規化 ISBN 取得書籍資料 (dict)，先查 ISBN 快取（行程內），未命中再查資料庫並寫入快取。
+    version 為查詢前取得的館藏版本號（未提供時在此取得）；快取項目的版本號不同時重新查詢，
+    其他 worker 異動過的書籍不會以舊資料回傳。
+    """
+    normalized = normalize_isbn(isbn)
+    if normalized is None:
+        return None
+    if version is None:
+        version = await caching.aget_catalogue_version()
+    book_data = caching.isbn_cache.get(normalized, version)
+    if book_data is None:
+        book_data = await book_values(Book.objects.filter(isbn_normalized=normalized)).afirst()
+        if book_data is not None:
+            caching.isbn_cache.set(normalized, book_data, version)
+    return book_data
+
+@require_http_methods(["GET"])
+def isbn_cache_stats_api(request):
+    # ISBN 快取的命中 / 未命中 / 淘汰次數（僅本行程）
+    return JsonResponse({'isbn_cache': caching.isbn_cache.stats()}, status=200)
+
 @require_http_methods(["GET"]) # 獲取單本書籍資訊的API
-def book_detail_api(request, identifier): # 修改：參數從 book_id 改為 identifier
+async def book_detail_api(request, identifier): # 修改：參數從 book_id 改為 identifier
+    # 館藏版本號未變時直接回傳 304，不查詢資料庫
+    version = await caching.aget_catalogue_version()
+    etag = caching.catalogue_etag(version)
+    if caching.etag_matches(request, etag):
+        return caching.not_modified(etag, CATALOGUE_CACHE_CONTROL)
     try:
-        # 嘗試將 identifier 轉換為整數，如果成功則按 ID 查詢
-        try:
-            book_id = int(identifier)
-            book = get_object_or_404(Book, pk=book_id)
-        except ValueError:
-            # 如果不是整數，則按 ISBN 查詢
-            book = get_object_or_404(Book, isbn=identifier)
-
-        book_data = {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'isbn': book.isbn,
-            'is_borrowed': book.is_borrowed,
-            'category': book.category,
-            'status': book.status,
-            # 移除以下行，因為您的模型中可能不存在這些屬性
-            # 'publisher': book.publisher, 
-            # 'publication_year': book.publication_year,
-            # 'description': book.description,
-        }
-        return JsonResponse({'book': book_data}, status=200)
+        # 短的純數字視為書籍 ID，其餘（包含 10 / 13 碼數字）視為 ISBN，經由 ISBN 快取查詢
+        if identifier.isdigit() and len(identifier) < 10:
+            book_data = await book_values(Book.objects.filter(pk=int(identifier))).afirst()
+        else:
+            # 以同一個版本號查詢 ISBN 快取，回傳的資料與 ETag 一致
+            book_data = await alookup_book_by_isbn(identifier, version)
+        if book_data is None:
+            return error_response('書籍不存在', status=404)
+
+        response = JsonResponse({'book': book_data}, status=200)
+        response['ETag'] = etag
+        response['Cache-Control'] = CATALOGUE_CACHE_CONTROL
+        return response
     except Book.DoesNotExist: # 處理書籍不存在的情況
         return error_response('書籍不存在', status=404)
     except Exception as e:
@@ -377,14 +1010,18 @@ def book_detail_api(request, identifier): # 修改：參數從 book_id 改為 id
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@retry_on_locked
 def return_book_by_book_and_user_api(request): # 新增：根據書籍ID和用戶ID歸還
     try:
         data = json.loads(request.body)
         book_id = data.get('book_id')
-        user_id = data.get('user_id')
 
-        if not book_id or not user_id:
-            return error_response('缺少書籍ID或用戶ID', status=400)
+        if not book_id:
+            return error_response('缺少書籍ID', status=400)
+
+        user_id, _, error = request_user(request, data.get('user_id'))
+        if error:
+            return error
 
         # 找到最近一條該用戶借閱該書籍且未歸還的記錄
         borrow_record = BorrowRecord.objects.filter(
@@ -396,74 +1033,103 @@ def return_book_by_book_and_user_api(request): # 新增：根據書籍ID和用
         if not borrow_record:
             return error_response('未找到該用戶借閱此書籍的未歸還記錄', status=404)
 
-        borrow_record.return_date = timezone.now()
-        borrow_record.returned = True
-        borrow_record.save()
-
-        # 更新書籍狀態為 AVAILABLE，除非原本是損壞或遺失
-        book = borrow_record.book
-        if book.status not in ['DAMAGED', 'LOST']:
-             book.status = 'AVAILABLE'
-        book.save()
+        # 歸還複本並將書籍狀態改回 AVAILABLE，除非原本是損壞或遺失
+        if not return_records([borrow_record]):
+            return error_response('此書已歸還', status=409)
 
         return JsonResponse({'message': '書籍歸還成功'}, status=200)
 
     except json.JSONDecodeError:
         return error_response('無效的 JSON 格式', status=400)
+    except OperationalError:
+        raise # 交給 retry_on_locked 重試
     except Exception as e:
         return error_response(f'歸還書籍失敗：{str(e)}', status=500)
 
 @require_http_methods(["GET"])
-def get_book_by_isbn(request, isbn):
+async def get_book_by_isbn(request, isbn):
     try:
-        book = Book.objects.get(isbn=isbn)
+        book = await alookup_book_by_isbn(isbn)
+        if book is None:
+            return JsonResponse({'message': '查無此書籍'}, status=404)
         return JsonResponse({'book': {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'isbn': book.isbn,
-            'category': book.category,
-            'status': book.status,
+            'id': book['id'],
+            'title': book['title'],
+            'author': book['author'],
+            'isbn': book['isbn'],
+            'category': book['category'],
+            'status': book['status'],
             # ...其他欄位...
         }})
-    except Book.DoesNotExist:
-        return JsonResponse({'message': '查無此書籍'}, status=404)
     except Exception as e:
         return JsonResponse({'message': f'伺服器錯誤: {str(e)}'}, status=500)
-# @csrf_exempt
-# @require_http_methods(["POST"]) 
-# def scan_code_api(request):
-#     try:
-#         data = json.loads(request.body)
-#         image_b64 = data.get('image')
-        
-#         if not image_b64:
-#             return error_response('未提供圖像數據', status=400)
-
-#         img_bytes = base64.b64decode(image_b64)
-#         np_arr = np.frombuffer(img_bytes, np.uint8)
-#         img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-#         if img is None:
-#             return error_response('無法解碼圖像', status=400)
-
-#         gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-#         decoded_objects = pyzbar_decode(gray_img)
-
-#         if decoded_objects:
-#             decoded_text = decoded_objects[0].data.decode('utf-8')
-#             # 提取邊界框資訊
-#             rect = decoded_objects[0].rect
-#             bounding_box = {
-#                 'x': rect.left,
-#                 'y': rect.top,
-#                 'width': rect.width,
-#                 'height': rect.height
-#             }
-#             return JsonResponse({'message': '成功辨識', 'decoded_text': decoded_text, 'bounding_box': bounding_box}, status=200)
-#         else:
-#             return JsonResponse({'message': '未找到條碼或QR碼'}, status=200)
-#     except json.JSONDecodeError:
-#         return error_response('無效的 JSON 數據', status=400)
-#     except Exception as e:
-#         return error_response(f'掃描過程中發生錯誤：{str(e)}', status=500)
+@replica_reads
+@require_http_methods(["GET"])
+def export_api(request, table):
+    """
+    串流匯出 books 或 borrow_records。
+    ?format=csv|jsonl|parquet（預設 csv），借閱紀錄可用 date_from / date_to（YYYY-MM-DD）篩選 borrow_date。
+    借閱紀錄含所有用戶的借閱歷史，需以館員（is_staff）的 token 呼叫。
+    """
+    error = staff_required_error(request)
+    if error:
+        return error
+    fmt = request.GET.get('format', 'csv')
+    try:
+        date_from = exporter.parse_date_param(request.GET.get('date_from'))
+        date_to = exporter.parse_date_param(request.GET.get('date_to'))
+        content = exporter.stream_export(table, fmt, date_from, date_to)
+    except ValueError as e:
+        return error_response(f'匯出失敗：{str(e)}', status=400)
+
+    response = streaming_response(request, content, exporter.EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{exporter.export_filename(table, fmt)}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# 條碼辨識：解碼交給 scanning 的行程池，辨識出的 ISBN 經由 ISBN 快取對應到書籍
+@csrf_exempt
+@require_http_methods(["POST"])
+async def scan_code_api(request):
+    """
+    辨識圖片中的所有條碼與 QR Code。以 multipart 上傳圖片（欄位 file），或直接以圖片作為請求內容（例如 Content-Type: image/jpeg）。
+    回傳每個條碼的類型、內容、外框 (rect) 與頂點 (polygon)；內容為 ISBN 時 book 為對應的書籍（館藏中沒有則為 null）。
+    """
+    limit = settings.SCAN_MAX_UPLOAD_BYTES
+    upload = request.FILES.get('file')
+    if upload is not None:
+        if upload.size > limit:
+            return error_response('圖片過大', status=413)
+        data = upload.read()
+    else:
+        if int(request.META.get('CONTENT_LENGTH') or 0) > limit:
+            return error_response('圖片過大', status=413)
+        # 以 read() 讀取，大小上限由 SCAN_MAX_UPLOAD_BYTES 決定，而非 request.body 的 DATA_UPLOAD_MAX_MEMORY_SIZE
+        data = request.read(limit + 1)
+        if len(data) > limit:
+            return error_response('圖片過大', status=413)
+    if not data:
+        return error_response('未提供圖像數據', status=400)
+
+    try:
+        codes = await scanning.adecode_image(data)
+    except ValueError as e:
+        return error_response(str(e), status=400)
+    except scanning.ScannerBusy:
+        response = error_response('辨識服務忙碌中，請稍後再試', status=503)
+        response['Retry-After'] = '1'
+        return response
+    except TimeoutError:
+        return error_response('辨識逾時', status=504)
+
+    books = {}
+    version = await caching.aget_catalogue_version()
+    for code in codes:
+        isbn = normalize_isbn(code['data'])
+        if isbn is None or not is_isbn13(isbn):
+            code['book'] = None
+            continue
+        if isbn not in books:
+            books[isbn] = await alookup_book_by_isbn(isbn, version)
+        code['book'] = books[isbn]
+    return JsonResponse({'message': '成功辨識' if codes else '未找到條碼或QR碼', 'codes': codes}, status=200)
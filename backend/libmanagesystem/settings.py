@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
 import os
 
 
@@ -23,12 +24,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-_=#ri30)*n3r$x1)&!_jcsebluzqzd##3$^-z!&_3@e&q%advv'
+# 正式環境（docker-compose）以環境變數設定，未設定時沿用開發用的金鑰
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-_=#ri30)*n3r$x1)&!_jcsebluzqzd##3$^-z!&_3@e&q%advv')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
 
 
 # Application definition
@@ -51,6 +53,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'libmanage.middleware.TokenAuthenticationMiddleware',
+    'libmanage.middleware.ReadReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,14 +84,103 @@ WSGI_APPLICATION = 'libmanagesystem.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# 預設使用 SQLite（開發）；設定 DATABASE_URL 時改用 PostgreSQL，例如
+#   postgres://user:password@db:5432/libmanage
+#   postgres://user@/libmanage?host=/var/run/postgresql（Unix socket）
+# PostgreSQL 預設使用 psycopg 連線池（DB_POOL=1）；ASGI 下每個請求在不同 thread 執行，
+# 持續連線 (CONN_MAX_AGE) 無法重用，連線池可避免每個請求重新連線。
+# 以 gthread / sync worker 執行 WSGI 時也可改設 DB_POOL=0 與 DB_CONN_MAX_AGE 使用持續連線。
+
+# SQLite 調校（單機部署）：每個連線建立時套用下列 PRAGMA。
+# WAL 讓讀取不被寫入阻塞；寫入交易以 BEGIN IMMEDIATE 開始，等不到寫入鎖時最多等待 SQLITE_BUSY_TIMEOUT 秒，
+# 仍逾時的寫入由 libmanage.retry.retry_on_locked 重試。
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # 負數的單位為 KiB
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KIB', 64 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL 會在資料庫旁建立 -wal / -shm 檔，Docker 須掛載整個目錄而非單一檔案
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            # sqlite3 的 timeout 即 busy_timeout（秒）
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5)),
+        },
     }
 }
 
 
+def _postgres_database(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('postgres', 'postgresql'):
+        raise ValueError(f'DATABASE_URL 只支援 PostgreSQL：{parts.scheme}')
+    options = dict(parse_qsl(parts.query))
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': options.pop('host', parts.hostname or ''),
+        'PORT': str(parts.port or ''),
+        'OPTIONS': options,
+        'CONN_HEALTH_CHECKS': True,
+        'CONN_MAX_AGE': 0,
+    }
+    if os.environ.get('DB_POOL', '1') == '1':
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    return database
+
+
+if os.environ.get('DATABASE_URL'):
+    DATABASES['default'] = _postgres_database(os.environ['DATABASE_URL'])
+
+# 唯讀副本（PostgreSQL 串流複寫）：設定 DATABASE_REPLICA_URL 時，書籍列表、用戶首頁與匯出從副本讀取。
+# 用戶寫入後 READ_REPLICA_PIN_SECONDS 秒內仍讀主資料庫，須大於副本的複寫延遲。
+# 固定狀態存在 Django cache，多個 worker 時請設定 REDIS_URL。
+READ_REPLICA_DATABASE = None
+READ_REPLICA_PIN_SECONDS = int(os.environ.get('READ_REPLICA_PIN_SECONDS', 5))
+
+if os.environ.get('DATABASE_REPLICA_URL'):
+    READ_REPLICA_DATABASE = 'replica'
+    DATABASES[READ_REPLICA_DATABASE] = _postgres_database(os.environ['DATABASE_REPLICA_URL'])
+    # 測試時副本指向主資料庫的測試資料庫
+    DATABASES[READ_REPLICA_DATABASE]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['libmanage.routers.ReadReplicaRouter']
+
+
+# Cache
+# 預設使用行程內的 locmem；設定 REDIS_URL 時改用 Redis，讓多個 worker 共用快取
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'libmanage',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -107,6 +200,53 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# PASSWORD_HASHER=scrypt|argon2|pbkdf2 選擇新密碼使用的演算法（argon2 需安裝 argon2-cffi）；
+# 其餘演算法保留用於驗證舊密碼，登入成功時會自動以目前的演算法與參數重新雜湊。
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))
+# 計算雜湊的 thread 數，未設定時為 min(4, CPU 數)
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 0)) or None
+
+if PASSWORD_HASHER == 'argon2':
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        PASSWORD_HASHER = 'scrypt'
+
+_PREFERRED_HASHERS = {
+    'scrypt': 'libmanage.hashers.TunedScryptPasswordHasher',
+    'argon2': 'libmanage.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PREFERRED_HASHERS[PASSWORD_HASHER]] + [
+    hasher for hasher in [
+        'libmanage.hashers.TunedScryptPasswordHasher',
+        'libmanage.hashers.TunedArgon2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ] if hasher != _PREFERRED_HASHERS[PASSWORD_HASHER]
+]
+
+# API bearer token 有效秒數；API_ALLOW_USER_ID_PARAM=1 時未帶 token 的請求仍可用 user_id 參數（僅供舊版前端過渡）
+API_TOKEN_MAX_AGE = int(os.environ.get('API_TOKEN_MAX_AGE', 8 * 60 * 60))
+API_ALLOW_USER_ID_PARAM = os.environ.get('API_ALLOW_USER_ID_PARAM', '0') == '1'
+
+# 登入限流預設依 REMOTE_ADDR 判斷來源；只有 Django 僅能經由 nginx 連線時才設為 1，改用 nginx 設定的 X-Real-IP，
+# 否則客戶端可以自行帶入任意 X-Real-IP 繞過每個 IP 的限流
+TRUST_X_REAL_IP = os.environ.get('TRUST_X_REAL_IP', '0') == '1'
+
+# 條碼辨識 (/api/scan_code/)：每個 worker 的解碼行程數（0 表示在請求的 thread 內直接解碼）、
+# 單張圖片的逾時秒數與大小上限（nginx 的 client_max_body_size 須不小於此值）
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', min(2, os.cpu_count() or 1)))
+SCAN_TIMEOUT = float(os.environ.get('SCAN_TIMEOUT', 5))
+SCAN_MAX_UPLOAD_BYTES = int(os.environ.get('SCAN_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -32,6 +32,8 @@ urlpatterns = [
     path('api/logout/', views.logout_api, name='api_logout'),
     path('api/user_home/', views.user_home_api, name='api_user_home'),
     path('api/books/', views.book_list_api, name='api_book_list'),
+    path('api/books/search/', views.book_search_api, name='api_book_search'),
+    path('api/books/bulk/', views.book_bulk_import_api, name='api_book_bulk_import'),
     path('api/books/create/', views.book_create_api, name='api_book_create'),
     path('api/books/delete/<int:book_id>/', views.book_delete_api, name='api_book_delete'),
     path('api/books/update/<int:book_id>/', views.update_book_api, name='api_book_update'),
@@ -39,10 +41,14 @@ urlpatterns = [
     path('api/books/<str:identifier>/', views.book_detail_api, name='api_book_detail'), # 獲取單本書籍的API (支援ID或ISBN)
     path('api/books/borrow/<int:book_id>/', views.borrow_book_api, name='api_borrow_book'),
     path('api/books/return/<int:record_id>/', views.return_book_api, name='api_return_book'),
-    # path('api/scan_code/', views.scan_code_api, name='api_scan_code'), 
+    path('api/books/borrow/batch/', views.batch_borrow_api, name='api_batch_borrow'),
+    path('api/books/return/batch/', views.batch_return_api, name='api_batch_return'),
+    path('api/scan_code/', views.scan_code_api, name='api_scan_code'),
     path('api/user/update_profile/', views.update_profile_api, name='api_update_profile'), 
     path('api/books/return_by_book_and_user/', views.return_book_by_book_and_user_api, name='api_return_book_by_book_and_user'),
     path('api/books/isbn/<str:isbn>/', views.get_book_by_isbn),
+    path('api/cache/isbn/', views.isbn_cache_stats_api, name='api_isbn_cache_stats'),
+    path('api/export/<str:table>/', views.export_api, name='api_export'),
 
     # === 服務 React 應用的入口點 (index.html) ===
     re_path(r'^(?:.*)/?$', TemplateView.as_view(template_name='index.html')),
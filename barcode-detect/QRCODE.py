@@ -1,21 +1,23 @@
-from PIL import Image
-from pyzbar.pyzbar import decode
+import cv2
 import json
 import qrcode
 
-def generate_book_qrcode(book_data, filename="book_qrcode.png"):
+from book_label import LabelError, encode_label, parse_scan
+from fast_decode import decode_pyramid
+
+def generate_book_qrcode(book_data, filename="book_qrcode.png", key=None):
     """
-    Generates a QR code from book information.
+    Generates a QR code label for a book.
+
+    The label only carries the book ID and the canonical ISBN-13 (see book_label.py), so it
+    stays valid when the title, category or status changes and fits in a small QR version.
 
     Args:
-        book_data (dict): A dictionary containing book details.
+        book_data (dict): A dictionary containing book details ('id', optional 'isbn').
         filename (str): The name of the output QR code image file.
+        key (str | bytes | None): HMAC key; when given the label is signed.
     """
-    qr_string = f"書名: {book_data['title']}\n" \
-                f"作者: {book_data['author']}\n" \
-                f"ISBN: {book_data['isbn']}\n" \
-                f"分類: {book_data['category']}\n" \
-                f"狀態: {book_data['status']}"
+    qr_string = encode_label(book_data['id'], book_data.get('isbn') or None, key=key)
 
     # Create QR code instance
     qr = qrcode.QRCode(
@@ -34,19 +36,22 @@ def generate_book_qrcode(book_data, filename="book_qrcode.png"):
     img.save(filename)
     print(f"QR code saved as {filename}")
 
-def scan_qr_code_and_display_json(image_path):
+def scan_qr_code_and_display_json(image_path, key=None):
     """
     掃描指定圖片中的QR Code，並將其內容解析為JSON格式顯示。
 
     Args:
         image_path (str): QR Code圖片的路徑。
+        key (str | bytes | None): 驗證書籤簽章的 HMAC key；指定時拒絕未簽章的書籤。
     """
     try:
-        # 開啟圖片
-        img = Image.open(image_path)
+        # 以灰階開啟圖片
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise FileNotFoundError(image_path)
 
-        # 掃描圖片中的所有條碼/QR Code
-        decoded_objects = decode(img)
+        # 掃描圖片中的條碼/QR Code，先解碼縮小的圖片，找不到才用原始解析度
+        decoded_objects, _ = decode_pyramid(gray)
 
         if not decoded_objects:
             print(f"在圖片 '{image_path}' 中找不到任何QR Code。")
@@ -57,16 +62,13 @@ def scan_qr_code_and_display_json(image_path):
             qr_data_raw = obj.data.decode('utf-8')
             print(f"掃描到的原始QR Code內容:\n{qr_data_raw}\n")
 
-            # 將原始字串解析為字典
-            # 這裡需要根據原始QR Code內容的格式進行解析
-            # 由於我們上次是使用 "鍵: 值" 的格式，這裡我們手動解析
-            parsed_data = {}
-            lines = qr_data_raw.split('\n')
-            for line in lines:
-                if ':' in line:
-                    key, value = line.split(':', 1) # 只在第一個冒號處分割
-                    parsed_data[key.strip()] = value.strip()
-            
+            # 解析書籤、ISBN 條碼或舊版 "鍵: 值" 格式的內容
+            try:
+                parsed_data = parse_scan(qr_data_raw, obj.type, key)
+            except LabelError as e:
+                print(f"無效的書籤：{e}")
+                continue
+
             # 將字典轉換為JSON格式
             json_output = json.dumps(parsed_data, indent=4, ensure_ascii=False)
             
@@ -85,6 +87,7 @@ def scan_qr_code_and_display_json(image_path):
     
 if __name__ == "__main__":
     book_info = {
+        "id": 1,
         "title": "React 思維進化",
         "author": "周晃安 (Zet)",
         "isbn": "978-626-333-769-5",
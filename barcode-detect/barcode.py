@@ -1,73 +1,81 @@
+import argparse
 import cv2
-from pyzbar.pyzbar import decode
 import json
+import os
 
-def scan_qr_code_from_webcam():
+from book_label import LabelError, parse_scan
+from scan_events import DEFAULT_TTL, BackendClient, ScanTracker
+from scan_pipeline import ScanPipeline
+
+def print_backend_result(items, data, error):
+    names = ', '.join(str(item) for item in items)
+    if error:
+        print(f"後端處理 {names} 失敗：{error}")
+    else:
+        print(f"後端回應 ({names})：{json.dumps(data, ensure_ascii=False)}")
+
+def scan_qr_code_from_webcam(source=0, headless=False, workers=2, realtime=None, ttl=DEFAULT_TTL, client=None, key=None):
     """
     使用網路攝影機掃描QR Code，並將其內容解析為JSON格式顯示。
+    擷取、解碼與顯示分別在不同的執行緒，解碼較慢時丟棄舊的幀，不會拖慢攝影機的幀率。
+
+    Args:
+        source (int | str): 攝影機編號，或影片檔路徑。
+        headless (bool): 不開啟視窗，讀完影片後印出處理速度（用於效能測試）。
+        workers (int): 解碼執行緒數。
+        realtime (bool | None): 影片檔是否依原本的 FPS 播放並丟棄來不及解碼的幀；None 表示攝影機才丟幀。
+        ttl (float): 同一個條碼離開畫面超過這個秒數後，再出現才視為新的掃描。
+        client (BackendClient | None): 將掃描到的書籍送往後端借書 / 還書 / 查詢。
+        key (str | None): 驗證書籤簽章的 HMAC key；指定時拒絕未簽章的書籤。
     """
     # 嘗試開啟預設的網路攝影機 (通常是0，如果有多個攝影機可以嘗試1, 2等)
-    cap = cv2.VideoCapture(0)
-
-    # 檢查攝影機是否成功開啟
-    if not cap.isOpened():
-        print("錯誤：無法開啟網路攝影機。請確認攝影機已連接且沒有被其他應用程式佔用。")
+    pipeline = ScanPipeline(source, workers=workers, realtime=realtime)
+    try:
+        pipeline.start()
+    except OSError:
+        # 檢查攝影機是否成功開啟
+        print("錯誤：無法開啟網路攝影機或影片檔。請確認攝影機已連接且沒有被其他應用程式佔用。")
         return
 
-    print("已開啟網路攝影機。請將QR Code置於攝影機前。")
-    print("按下 'q' 鍵可退出。")
-
-    detected_qr_code_data = None # 用於儲存掃描到的QR Code內容
-
-    while True:
-        # 逐幀讀取影像
-        ret, frame = cap.read()
-
-        if not ret:
-            print("無法從攝影機讀取幀。")
-            break
-
-        # 將彩色影像轉換為灰度影像，pyzbar在灰度影像上工作得更好
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # 掃描灰度影像中的所有條碼/QR Code
-        decoded_objects = decode(gray)
-
-        if decoded_objects:
-            for obj in decoded_objects:
-                qr_data_raw = obj.data.decode('utf-8')
-                
-                # 如果是新的或不同的QR Code內容，則處理並顯示
-                if qr_data_raw != detected_qr_code_data:
-                    detected_qr_code_data = qr_data_raw
-                    print(f"\n--- 掃描到新的QR Code ---")
-                    print(f"原始QR Code內容:\n{qr_data_raw}\n")
-
-                    # 解析原始字串為字典
-                    parsed_data = {}
-                    lines = qr_data_raw.split('\n')
-                    for line in lines:
-                        if ':' in line:
-                            key, value = line.split(':', 1)
-                            parsed_data[key.strip()] = value.strip()
-                    
-                    # 將字典轉換為JSON格式
-                    # 如果QR Code內容只有ISBN，就直接以ISBN作為值
-                    if "ISBN: " in qr_data_raw and len(lines) == 1:
-                         isbn_value = qr_data_raw.replace("ISBN: ", "").strip()
-                         json_output = json.dumps({"ISBN": isbn_value}, indent=4, ensure_ascii=False)
-                    elif parsed_data: # 檢查是否成功解析出鍵值對
-                        json_output = json.dumps(parsed_data, indent=4, ensure_ascii=False)
-                    else: # 如果無法解析為鍵值對，直接將原始內容作為一個值
-                        json_output = json.dumps({"content": qr_data_raw}, indent=4, ensure_ascii=False)
-
-                    print("QR Code內容 (JSON格式):")
-                    print(json_output)
-                    print("-------------------------\n")
-
-                # 在QR Code周圍繪製邊框 (可選，用於視覺化)
-                (x, y, w, h) = obj.rect
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2) # 綠色框
+    if not headless:
+        print("已開啟網路攝影機。請將QR Code置於攝影機前。")
+        print("按下 'q' 鍵可退出。")
+
+    tracker = ScanTracker(ttl) # 每個條碼在畫面中持續出現時只處理一次
+    last_shown = -1 # 已顯示的最新幀編號，較舊的幀（其他解碼執行緒較晚完成）不再顯示
+
+    for index, frame, decoded_objects in pipeline.results():
+        codes = [(obj.data.decode('utf-8'), obj.type) for obj in decoded_objects]
+        # 只處理新出現的條碼（同一幀中的多個條碼各自判斷）
+        for event in tracker.update(codes):
+            qr_data_raw = event.data
+            print(f"\n--- 掃描到新的{'條碼' if event.type == 'EAN13' else 'QR Code'} ---")
+            print(f"原始內容:\n{qr_data_raw}\n")
+
+            # 解析書籤、ISBN 條碼或舊版 "鍵: 值" 格式的內容
+            try:
+                parsed_data = parse_scan(qr_data_raw, event.type, key)
+            except LabelError as e:
+                print(f"無效的書籤：{e}")
+                continue
+
+            # 將字典轉換為JSON格式
+            print("內容 (JSON格式):")
+            print(json.dumps(parsed_data, indent=4, ensure_ascii=False))
+            print("-------------------------\n")
+
+            # 送往後端（批次送出，不會等待網路）
+            if client is not None:
+                client.submit(book_id=parsed_data.get('book_id'), isbn=parsed_data.get('isbn'))
+
+        # 在條碼周圍繪製邊框 (可選，用於視覺化)
+        for obj in decoded_objects:
+            (x, y, w, h) = obj.rect
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2) # 綠色框
+
+        if headless or index < last_shown:
+            continue
+        last_shown = index
 
         # 顯示影像幀
         cv2.imshow('QR Code Scanner', frame)
@@ -76,11 +84,41 @@ def scan_qr_code_from_webcam():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    # 釋放攝影機資源
-    cap.release()
-    # 關閉所有OpenCV視窗
-    cv2.destroyAllWindows()
+    # 停止擷取與解碼執行緒並釋放攝影機資源，送出尚未送出的掃描
+    pipeline.stop()
+    if client is not None:
+        client.close()
+    if headless:
+        summary = pipeline.summary()
+        print(f"讀取 {summary['captured']} 幀，丟棄 {summary['dropped']} 幀，解碼 {summary['decoded']} 幀"
+              f"（{summary['decoded_per_second']:.1f} 幀/秒），{summary['hits']} 幀找到條碼")
+    else:
+        # 關閉所有OpenCV視窗
+        cv2.destroyAllWindows()
     print("程式已結束。")
 
 if __name__ == "__main__":
-    scan_qr_code_from_webcam()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="以網路攝影機或影片檔掃描QR Code / 條碼")
+    parser.add_argument("--video", help="讀取影片檔而非攝影機")
+    parser.add_argument("--camera", type=int, default=0, help="攝影機編號")
+    parser.add_argument("--headless", action="store_true", help="不顯示視窗，結束時印出處理速度")
+    parser.add_argument("--workers", type=int, default=2, help="解碼執行緒數")
+    parser.add_argument("--realtime", action="store_true", help="影片檔依原本的 FPS 播放，來不及解碼的幀會被丟棄")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="同一個條碼離開畫面多少秒後再出現才視為新的掃描")
+    parser.add_argument("--server", help="後端網址，例如 http://127.0.0.1:8000；未指定時只印出結果")
+    parser.add_argument("--mode", choices=["lookup", "borrow", "return"], default="lookup", help="掃描後查詢書籍、借書或還書")
+    parser.add_argument("--token", default=os.environ.get("LIBMANAGE_TOKEN"), help="登入 API 取得的 token（借書 / 還書需要），預設讀取 LIBMANAGE_TOKEN")
+    parser.add_argument("--label-key", default=os.environ.get("LIBMANAGE_LABEL_KEY"), help="驗證書籤簽章的 key（指定時拒絕未簽章的書籤），預設讀取 LIBMANAGE_LABEL_KEY")
+    args = parser.parse_args()
+    client = None
+    if args.server:
+        client = BackendClient(args.server, token=args.token, mode=args.mode, on_result=print_backend_result)
+    scan_qr_code_from_webcam(
+        args.video if args.video else args.camera,
+        headless=args.headless,
+        workers=args.workers,
+        realtime=True if args.realtime else None,
+        ttl=args.ttl,
+        client=client,
+        key=args.label_key,
+    )
\ No newline at end of file
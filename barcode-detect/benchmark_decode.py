@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+
+import cv2
+from pyzbar.pyzbar import decode
+
+from fast_decode import FastDecoder, decode_pyramid
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_images(folder):
+    """
+    讀取資料夾中的所有圖片（灰階），回傳 [(檔名, 影像)]。
+    """
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            gray = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+            if gray is not None:
+                images.append((name, gray))
+    return images
+
+
+def run(frames, decode_frame):
+    hits = 0
+    start = time.perf_counter()
+    for gray in frames:
+        if decode_frame(gray):
+            hits += 1
+    return len(frames) / (time.perf_counter() - start), hits / len(frames)
+
+
+def benchmark(folder, repeat):
+    """
+    比較三種解碼方式：
+    - 原始：全解析度、搜尋所有條碼類型（與原本的 QRCODE.py / barcode.py 相同）
+    - 金字塔：只搜尋 EAN-13 / QR Code，先解碼縮小的影像
+    - 金字塔 + ROI：每張圖片連續出現 repeat 次（模擬書本停在攝影機前），重用上一次找到條碼的區域
+    """
+    images = load_images(folder)
+    if not images:
+        print(f"在 '{folder}' 中找不到圖片。")
+        return
+    frames = [gray for _, gray in images for _ in range(repeat)]
+    decoder = FastDecoder()
+    results = [
+        ('原始', run(frames, decode)),
+        ('金字塔', run(frames, lambda gray: decode_pyramid(gray)[0])),
+        ('金字塔 + ROI', run(frames, decoder.decode)),
+    ]
+    print(f"{len(images)} 張圖片，每張 {repeat} 次，共 {len(frames)} 幀")
+    for label, (per_second, hit_rate) in results:
+        print(f"{label}：{per_second:.1f} 幀/秒，命中率 {hit_rate:.0%}")
+    print("金字塔 + ROI 各階段：" + "，".join(f"{stage or '未找到'} {count}" for stage, count in decoder.stats.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="條碼解碼效能測試")
+    parser.add_argument("folder", nargs="?", default=os.path.dirname(os.path.abspath(__file__)), help="圖片資料夾（預設為本資料夾）")
+    parser.add_argument("--repeat", type=int, default=10, help="每張圖片連續解碼的次數")
+    args = parser.parse_args()
+    benchmark(args.folder, args.repeat)
@@ -0,0 +1,150 @@
+import base64
+import collections
+import hashlib
+import hmac
+import re
+
+# 書籤 QR Code 內容："LB" + base32(二進位內容)，只用 QR Code 英數模式 (alphanumeric) 的字元。
+# zbar 會把位元組模式 (byte mode) 的內容猜測編碼轉成文字，不適合直接放二進位資料；
+# base32 在英數模式每字元 5.5 bits，比位元組模式的 8 bits 更省空間。
+#
+# 二進位內容（版本 1）：
+#   1 byte    版本
+#   1 byte    旗標：FLAG_ISBN 有 ISBN、FLAG_SIGNED 有簽章
+#   varint    書籍 id（LEB128，無號）
+#   6 bytes   ISBN-13 轉為整數（big-endian），有 FLAG_ISBN 時才有
+#   8 bytes   以上所有位元組的 HMAC-SHA256 前 8 bytes，有 FLAG_SIGNED 時才有
+# 只放不會變動的書籍 id 與 ISBN；書名、狀態等由掃描端向後端查詢。
+PREFIX = 'LB'
+VERSION = 1
+FLAG_ISBN = 0x01
+FLAG_SIGNED = 0x02
+ISBN_BYTES = 6
+SIGNATURE_BYTES = 8
+
+ISBN13_RE = re.compile(r'97[89][0-9]{10}')
+
+BookLabel = collections.namedtuple('BookLabel', 'version book_id isbn signed verified')
+
+
+class LabelError(ValueError):
+    """
+    以 PREFIX 開頭但內容損壞、版本不支援、簽章不符或應有簽章卻未簽章。
+    """
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        if offset >= len(data) or shift > 63:
+            raise LabelError('書籍 id 格式錯誤')
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def _signature(key, data):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return hmac.new(key, data, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode_label(book_id, isbn=None, key=None):
+    """
+    產生書籤 QR Code 的內容字串。isbn 須為 ISBN-13（可含連字號）；key 不為 None 時附上 HMAC 簽章。
+    """
+    flags = 0
+    body = _varint(int(book_id))
+    if isbn:
+        isbn = isbn.replace('-', '').replace(' ', '')
+        if not ISBN13_RE.fullmatch(isbn):
+            raise ValueError(f'不是 ISBN-13：{isbn}')
+        flags |= FLAG_ISBN
+        body += int(isbn).to_bytes(ISBN_BYTES, 'big')
+    if key is not None:
+        flags |= FLAG_SIGNED
+    data = bytes([VERSION, flags]) + body
+    if key is not None:
+        data += _signature(key, data)
+    return PREFIX + base64.b32encode(data).decode('ascii').rstrip('=')
+
+
+def parse_label(text, key=None):
+    """
+    解析書籤內容，不是書籤格式時回傳 None，格式損壞時拋出 LabelError。
+    提供 key 時書籤必須有簽章且簽章相符，否則拋出 LabelError；verified 表示是否已驗證。
+    未提供 key 時不驗證簽章。
+    """
+    if not text.startswith(PREFIX):
+        return None
+    encoded = text[len(PREFIX):].strip()
+    try:
+        data = base64.b32decode(encoded + '=' * (-len(encoded) % 8))
+    except ValueError:
+        raise LabelError('書籤內容不是 base32')
+    if len(data) < 3:
+        raise LabelError('書籤內容過短')
+    version, flags = data[0], data[1]
+    if version != VERSION:
+        raise LabelError(f'不支援的書籤版本 {version}')
+    book_id, offset = _read_varint(data, 2)
+    isbn = None
+    if flags & FLAG_ISBN:
+        isbn = str(int.from_bytes(data[offset:offset + ISBN_BYTES], 'big'))
+        offset += ISBN_BYTES
+    signed = bool(flags & FLAG_SIGNED)
+    if key is not None and not signed:
+        # 有 key 時拒絕未簽章的書籤，否則任何人都能印出指向任意書籍 id 的書籤
+        raise LabelError('書籤未簽章')
+    verified = False
+    if signed:
+        signature = data[offset:offset + SIGNATURE_BYTES]
+        offset += SIGNATURE_BYTES
+        if key is not None:
+            if not hmac.compare_digest(signature, _signature(key, data[:offset - SIGNATURE_BYTES])):
+                raise LabelError('書籤簽章不符')
+            verified = True
+    if offset != len(data) or (isbn is not None and not ISBN13_RE.fullmatch(isbn)):
+        raise LabelError('書籤內容長度不符')
+    return BookLabel(version, book_id, isbn, signed, verified)
+
+
+def parse_scan(data, code_type, key=None):
+    """
+    將任一種掃描結果轉為 dict：
+    - 書籤 QR Code：{"book_id", "isbn", "signed", "verified"}
+    - 書背 EAN-13 條碼（978 / 979 開頭）：{"isbn"}
+    - 舊版 "鍵: 值" 多行文字的 QR Code：各行的鍵值，有 "ISBN" 行時另外放在 "isbn"
+    - 其他：{"content": 原始內容}
+    書籤格式損壞、簽章不符或提供 key 但書籤未簽章時拋出 LabelError。
+    """
+    label = parse_label(data, key)
+    if label is not None:
+        return {'book_id': label.book_id, 'isbn': label.isbn, 'signed': label.signed, 'verified': label.verified}
+    if code_type == 'EAN13':
+        return {'isbn': data} if ISBN13_RE.fullmatch(data) else {'content': data}
+    parsed = {}
+    for line in data.split('\n'):
+        key_text, sep, value = line.partition(':')
+        if sep:
+            parsed[key_text.strip()] = value.strip()
+    if not parsed:
+        return {'content': data}
+    if parsed.get('ISBN'):
+        parsed['isbn'] = parsed['ISBN'].replace('-', '').replace(' ', '')
+    return parsed
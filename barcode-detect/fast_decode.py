@@ -0,0 +1,93 @@
+import collections
+
+import cv2
+from pyzbar.pyzbar import decode, ZBarSymbol
+
+# 書籍條碼 (ISBN / EAN-13) 與書籤 QR Code 以外的條碼類型不搜尋，zbar 可少跑好幾種解碼器
+SYMBOLS = (ZBarSymbol.EAN13, ZBarSymbol.QRCODE)
+# 影像金字塔：依序將長邊縮到這些像素數試解，都找不到才用原始解析度
+PYRAMID_LEVELS = (640, 1280)
+# 上一次找到條碼的區域 (ROI) 向外擴大的比例（相對於條碼寬高）
+ROI_MARGIN = 0.5
+
+Rect = collections.namedtuple('Rect', 'left top width height')
+Code = collections.namedtuple('Code', 'data type rect polygon')
+
+
+def _decode_region(gray, symbols, scale=1.0, offset=(0, 0)):
+    """
+    解碼 gray，將結果的座標換算回原始影像（除以 scale 再加上 offset）。
+    """
+    ox, oy = offset
+    codes = []
+    for obj in decode(gray, symbols=symbols):
+        polygon = [(int(p.x / scale) + ox, int(p.y / scale) + oy) for p in obj.polygon]
+        rect = obj.rect
+        codes.append(Code(
+            data=obj.data,
+            type=obj.type,
+            rect=Rect(int(rect.left / scale) + ox, int(rect.top / scale) + oy, int(rect.width / scale), int(rect.height / scale)),
+            polygon=polygon,
+        ))
+    return codes
+
+
+def decode_pyramid(gray, symbols=SYMBOLS, levels=PYRAMID_LEVELS):
+    """
+    先在縮小的影像上解碼，找不到才逐級放大，最後用原始解析度。
+    回傳 (codes, stage)，stage 為找到條碼的長邊像素數、'full' 或 None（都找不到）。
+    """
+    longest = max(gray.shape[:2])
+    for level in levels:
+        if level >= longest:
+            break
+        scale = level / longest
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        codes = _decode_region(small, symbols, scale)
+        if codes:
+            return codes, level
+    codes = _decode_region(gray, symbols)
+    return codes, 'full' if codes else None
+
+
+class FastDecoder:
+    """
+    連續影格用的解碼器：先只解碼上一次找到條碼的區域 (ROI)，找不到再走 decode_pyramid。
+    ROI 內有條碼時不會再搜尋整張影像，同一畫面中 ROI 以外的其他條碼要等 ROI 失效後的影格才會找到。
+    stats 記錄各階段找到條碼的次數（'roi'、金字塔各級、'full'）與找不到的次數 (None)。
+    """
+    def __init__(self, symbols=SYMBOLS, levels=PYRAMID_LEVELS, roi_margin=ROI_MARGIN):
+        self.symbols = symbols
+        self.levels = levels
+        self.roi_margin = roi_margin
+        self.roi = None
+        self.stats = collections.Counter()
+
+    def reset(self):
+        self.roi = None
+
+    def decode(self, gray):
+        """
+        解碼灰階影像 (numpy array)，回傳 Code 串列，座標為原始影像座標。
+        """
+        codes, stage = [], None
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            codes = _decode_region(gray[y0:y1, x0:x1], self.symbols, offset=(x0, y0))
+            stage = 'roi' if codes else None
+        if not codes:
+            codes, stage = decode_pyramid(gray, self.symbols, self.levels)
+        self.roi = self._region_of(codes, gray.shape) if codes else None
+        self.stats[stage] += 1
+        return codes
+
+    def _region_of(self, codes, shape):
+        # 所有條碼外框的聯集，向外擴大 roi_margin，限制在影像範圍內
+        height, width = shape[:2]
+        left = min(code.rect.left for code in codes)
+        top = min(code.rect.top for code in codes)
+        right = max(code.rect.left + code.rect.width for code in codes)
+        bottom = max(code.rect.top + code.rect.height for code in codes)
+        mx = int((right - left) * self.roi_margin) + 1
+        my = int((bottom - top) * self.roi_margin) + 1
+        return max(0, left - mx), max(0, top - my), min(width, right + mx), min(height, bottom + my)
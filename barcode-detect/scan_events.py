@@ -0,0 +1,177 @@
+import collections
+import http.client
+import json
+import queue
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+# 同一個條碼最後一次出現後，超過這個秒數才視為離開畫面，再次出現時才是新的掃描
+DEFAULT_TTL = 2.0
+# 與後端 BATCH_MAX_ITEMS 相同
+MAX_BATCH_SIZE = 50
+# 第一筆掃描進來後最多等待這麼多秒就送出批次
+DEFAULT_FLUSH_INTERVAL = 1.0
+# 借書 / 還書前 keep-alive 連線閒置超過這個秒數就重新連線（uvicorn 預設 5 秒後關閉閒置連線），
+# 這類請求失敗時不重送，避免送到已被伺服器關閉的連線
+POST_IDLE_RECONNECT = 1.0
+
+ScanEvent = collections.namedtuple('ScanEvent', 'data type seen_at')
+
+
+class ScanTracker:
+    """
+    依條碼內容去重。同一個條碼持續出現在畫面中只產生一次事件，每次看到都會延長它的 TTL；
+    超過 ttl 秒沒有再看到才移除，之後再出現就是新的事件。同一幀中的多個條碼各自追蹤。
+    """
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.last_seen = {}
+
+    def update(self, codes):
+        """
+        codes 為 [(內容, 類型)]，回傳這一幀中新出現的 ScanEvent。
+        """
+        now = self.clock()
+        for key, seen in list(self.last_seen.items()):
+            if now - seen > self.ttl:
+                del self.last_seen[key]
+        events = []
+        for data, code_type in codes:
+            key = (code_type, data)
+            if key not in self.last_seen:
+                events.append(ScanEvent(data, code_type, now))
+            self.last_seen[key] = now
+        return events
+
+    def active(self):
+        # 目前仍在畫面中（TTL 內）的條碼
+        return [data for _, data in self.last_seen]
+
+
+class BackendClient:
+    """
+    將掃描到的書籍（書籤的書籍 id 或 ISBN）批次送往後端，呼叫端 (submit) 不會等待網路。
+    - mode='borrow' / 'return'：累積最多 batch_size 本或 flush_interval 秒後，以一個請求呼叫批次借書 / 還書 API（需 token）。
+    - mode='lookup'：每本書呼叫一次書籍 / ISBN 查詢 API。
+    單一送出執行緒以一條 keep-alive 連線送出所有請求。連線被伺服器關閉時，只有查詢 (GET) 會重新連線並重送一次；
+    借書 / 還書的 POST 可能已被後端處理，不重送，錯誤交給 on_result。
+    on_result(items, 回應 JSON 或 None, 錯誤訊息或 None) 在送出執行緒中呼叫，items 為書籍 id 或 ISBN。
+    """
+    ENDPOINTS = {
+        'borrow': '/api/books/borrow/batch/',
+        'return': '/api/books/return/batch/',
+    }
+
+    def __init__(self, base_url, token=None, mode='lookup', batch_size=MAX_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, on_result=None, timeout=10):
+        if mode not in ('lookup', *self.ENDPOINTS):
+            raise ValueError(f"未知的模式 {mode!r}")
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.token = token
+        self.mode = mode
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.on_result = on_result or (lambda items, data, error: None)
+        self.timeout = timeout
+        self.connection = None
+        self.last_used = 0.0
+        self.pending = queue.Queue()
+        self.stats = collections.Counter()
+        self.thread = threading.Thread(target=self._send_loop, name='scan-backend', daemon=True)
+        self.thread.start()
+
+    def submit(self, book_id=None, isbn=None):
+        # 書籤上的書籍 id 優先；書背條碼只有 ISBN
+        if book_id is not None:
+            self.pending.put(('book_ids', book_id))
+        elif isbn:
+            self.pending.put(('isbns', isbn))
+
+    def close(self):
+        # 送出尚未送出的批次後結束
+        self.pending.put(None)
+        self.thread.join()
+        if self.connection is not None:
+            self.connection.close()
+
+    def _send_loop(self):
+        stopping = False
+        while not stopping:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.pending.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._send_batch(list(dict.fromkeys(batch)))
+
+    def _send_batch(self, batch):
+        if self.mode == 'lookup':
+            for key, value in batch:
+                path = f'/api/books/{int(value)}/' if key == 'book_ids' else f'/api/books/isbn/{quote(value)}/'
+                self._deliver([value], 'GET', path)
+        else:
+            payload = {'book_ids': [], 'isbns': []}
+            for key, value in batch:
+                payload[key].append(value)
+            self._deliver([value for _, value in batch], 'POST', self.ENDPOINTS[self.mode], payload)
+
+    def _deliver(self, items, method, path, payload=None):
+        try:
+            status, data = self._request(method, path, payload)
+        except (OSError, http.client.HTTPException) as e:
+            self.stats['errors'] += 1
+            self.on_result(items, None, str(e))
+            return
+        self.stats['requests'] += 1
+        # 查無書籍時回傳 404，仍是有效的回應
+        error = None if status < 400 or (self.mode == 'lookup' and status == 404) else data.get('message', f'HTTP {status}')
+        self.on_result(items, data, error)
+
+    def _request(self, method, path, payload):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        idempotent = method == 'GET'
+        if not idempotent and self.connection is not None and time.monotonic() - self.last_used > POST_IDLE_RECONNECT:
+            self.connection.close()
+            self.connection = None
+        for attempt in range(2 if idempotent else 1):
+            if self.connection is None:
+                self.connection = self.connection_class(self.netloc, timeout=self.timeout)
+            try:
+                self.connection.request(method, self.prefix + path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # keep-alive 連線已被伺服器關閉（例如閒置逾時）。查詢重新連線後重送一次；
+                # 借書 / 還書無法得知後端是否已處理，重送可能重複借還，交給呼叫端處理
+                self.connection.close()
+                self.connection = None
+                if attempt or not idempotent:
+                    raise
+                continue
+            self.last_used = time.monotonic()
+            if response.will_close:
+                self.connection.close()
+                self.connection = None
+            try:
+                return response.status, json.loads(content)
+            except ValueError:
+                return response.status, {'message': content.decode('utf-8', errors='replace')[:200]}
@@ -0,0 +1,146 @@
+import collections
+import queue
+import threading
+import time
+
+import cv2
+
+from fast_decode import FastDecoder
+
+
+class FrameBuffer:
+    """
+    有上限的環形緩衝區。drop_oldest 為 True 時（攝影機），滿了就丟掉最舊的幀，解碼永遠處理最新的畫面；
+    為 False 時（影片檔、不模擬即時）put 會等待空位，不丟幀。
+    """
+    def __init__(self, capacity, drop_oldest=True):
+        self.frames = collections.deque(maxlen=capacity)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            if not self.drop_oldest:
+                self.condition.wait_for(lambda: len(self.frames) < self.frames.maxlen or self.closed)
+            elif len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(item)
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        取出最舊的一幀；緩衝區已關閉且沒有剩餘的幀時回傳 None。
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frames or self.closed)
+            if not self.frames:
+                return None
+            item = self.frames.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class ScanPipeline:
+    """
+    擷取 / 解碼 / 結果三段式管線：
+    - 擷取執行緒從 cv2.VideoCapture 讀取影格放入 FrameBuffer。
+    - workers 個解碼執行緒各自以 FastDecoder 解碼（OpenCV 與 pyzbar 的 C 函式執行時會釋放 GIL）。
+    - 呼叫端在主執行緒以 results() 取得 (幀編號, 影格, 條碼)，顯示視窗 (cv2.imshow) 須在主執行緒。
+    source 為攝影機編號或影片檔路徑；影片檔預設盡快讀取且不丟幀，realtime=True 時依影片 FPS 播放並丟棄來不及解碼的幀，模擬攝影機。
+    """
+    def __init__(self, source=0, workers=2, buffer_size=4, realtime=None):
+        self.source = source
+        self.workers = workers
+        self.is_camera = isinstance(source, int)
+        self.realtime = self.is_camera if realtime is None else realtime
+        self.buffer = FrameBuffer(buffer_size, drop_oldest=self.realtime)
+        self.output = queue.Queue()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.capture = None
+        self.stats = collections.Counter()
+        self.started_at = None
+
+    def start(self):
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise OSError(f"無法開啟影像來源 {self.source!r}")
+        self.started_at = time.perf_counter()
+        self.threads = [threading.Thread(target=self._capture_loop, name='scan-capture', daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._decode_loop, name=f'scan-decode-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.buffer.close()
+        for thread in self.threads:
+            thread.join()
+        if self.capture is not None:
+            self.capture.release()
+
+    def _capture_loop(self):
+        fps = self.capture.get(cv2.CAP_PROP_FPS) if not self.is_camera else 0
+        interval = 1 / fps if self.realtime and fps > 0 else 0
+        next_at = time.perf_counter()
+        index = 0
+        while not self.stopping.is_set():
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            self.buffer.put((index, frame))
+            self.stats['captured'] += 1
+            index += 1
+            if interval:
+                next_at += interval
+                time.sleep(max(0, next_at - time.perf_counter()))
+        self.buffer.close()
+
+    def _decode_loop(self):
+        decoder = FastDecoder()
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                break
+            index, frame = item
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            self.output.put((index, frame, decoder.decode(gray)))
+        # 每個解碼執行緒結束時送出一個 None，全部送出後 results() 結束
+        self.output.put(None)
+
+    def results(self):
+        """
+        依完成順序產生 (幀編號, 影格, 條碼)；多個解碼執行緒時幀編號可能不是遞增的。來源讀完且全部解碼後結束。
+        """
+        finished = 0
+        while finished < self.workers:
+            item = self.output.get()
+            if item is None:
+                finished += 1
+                continue
+            self.stats['decoded'] += 1
+            if item[2]:
+                self.stats['hits'] += 1
+            yield item
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            'captured': self.stats['captured'],
+            'dropped': self.buffer.dropped,
+            'decoded': self.stats['decoded'],
+            'hits': self.stats['hits'],
+            'seconds': elapsed,
+            'decoded_per_second': self.stats['decoded'] / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,81 @@
+import unittest
+
+from book_label import PREFIX, BookLabel, LabelError, encode_label, parse_label, parse_scan
+
+
+class EncodeLabelTest(unittest.TestCase):
+    def test_round_trip(self):
+        text = encode_label(1234, '978-626-333-769-5')
+        self.assertTrue(text.startswith(PREFIX))
+        self.assertEqual(parse_label(text), BookLabel(1, 1234, '9786263337695', False, False))
+
+    def test_without_isbn_and_large_id(self):
+        self.assertEqual(parse_label(encode_label(7)), BookLabel(1, 7, None, False, False))
+        self.assertEqual(parse_label(encode_label(2 ** 40)).book_id, 2 ** 40)
+
+    def test_qr_alphanumeric_only(self):
+        # QR Code 英數模式只有大寫英文、數字與少數符號
+        self.assertRegex(encode_label(99, '9780306406157', key='secret'), r'^[0-9A-Z]+$')
+
+    def test_rejects_non_isbn13(self):
+        with self.assertRaises(ValueError):
+            encode_label(1, '0306406152')
+
+
+class ParseLabelTest(unittest.TestCase):
+    def setUp(self):
+        self.signed = encode_label(1234, '9786263337695', key='secret')
+
+    def test_not_a_label(self):
+        self.assertIsNone(parse_label('9786263337695'))
+
+    def test_signed_label(self):
+        self.assertEqual(parse_label(self.signed, 'secret'), BookLabel(1, 1234, '9786263337695', True, True))
+        # 未提供 key 時不驗證
+        self.assertEqual(parse_label(self.signed), BookLabel(1, 1234, '9786263337695', True, False))
+
+    def test_wrong_key(self):
+        with self.assertRaisesRegex(LabelError, '簽章不符'):
+            parse_label(self.signed, 'other')
+
+    def test_tampered(self):
+        tampered = self.signed[:-3] + ('A' if self.signed[-3] != 'A' else 'B') + self.signed[-2:]
+        with self.assertRaises(LabelError):
+            parse_label(tampered, 'secret')
+
+    def test_unsigned_rejected_when_key_given(self):
+        with self.assertRaisesRegex(LabelError, '未簽章'):
+            parse_label(encode_label(1234, '9786263337695'), 'secret')
+
+    def test_corrupt(self):
+        for text in ('LB!!', 'LBAE', self.signed[:-4]):
+            with self.assertRaises(LabelError, msg=text):
+                parse_label(text)
+        with self.assertRaisesRegex(LabelError, '版本'):
+            parse_label(PREFIX + 'AIAAK') # 版本 2
+
+
+class ParseScanTest(unittest.TestCase):
+    def test_label(self):
+        self.assertEqual(parse_scan(encode_label(5, '9780306406157'), 'QRCODE'),
+                         {'book_id': 5, 'isbn': '9780306406157', 'signed': False, 'verified': False})
+
+    def test_unsigned_label_with_key(self):
+        with self.assertRaises(LabelError):
+            parse_scan(encode_label(5), 'QRCODE', key='secret')
+
+    def test_ean13(self):
+        self.assertEqual(parse_scan('9780306406157', 'EAN13'), {'isbn': '9780306406157'})
+        self.assertEqual(parse_scan('4710088412345', 'EAN13'), {'content': '4710088412345'})
+
+    def test_legacy_key_value(self):
+        parsed = parse_scan('書名: React 思維進化\nISBN: 978-626-333-769-5', 'QRCODE')
+        self.assertEqual(parsed['書名'], 'React 思維進化')
+        self.assertEqual(parsed['isbn'], '9786263337695')
+
+    def test_other_content(self):
+        self.assertEqual(parse_scan('hello', 'QRCODE'), {'content': 'hello'})
+
+
+if __name__ == '__main__':
+    unittest.main()
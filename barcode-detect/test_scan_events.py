@@ -0,0 +1,151 @@
+import http.client
+import json
+import threading
+import unittest
+from unittest import mock
+
+import scan_events
+from scan_events import BackendClient, ScanTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScanTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracker = ScanTracker(ttl=2, clock=self.clock)
+
+    def test_code_in_view_is_reported_once(self):
+        self.assertEqual([event.data for event in self.tracker.update([('A', 'QRCODE')])], ['A'])
+        for _ in range(5):
+            self.clock.now += 1.5 # 每次看到都延長 TTL
+            self.assertEqual(self.tracker.update([('A', 'QRCODE')]), [])
+        self.assertEqual(self.tracker.active(), ['A'])
+
+    def test_code_seen_again_after_ttl(self):
+        self.tracker.update([('A', 'QRCODE')])
+        self.clock.now = 2.5
+        self.assertEqual(self.tracker.update([]), [])
+        self.assertEqual(self.tracker.active(), [])
+        self.assertEqual([event.data for event in self.tracker.update([('A', 'QRCODE')])], ['A'])
+
+    def test_several_codes_in_one_frame(self):
+        events = self.tracker.update([('A', 'QRCODE'), ('9780306406157', 'EAN13')])
+        self.assertEqual([(event.data, event.type) for event in events], [('A', 'QRCODE'), ('9780306406157', 'EAN13')])
+        events = self.tracker.update([('A', 'QRCODE'), ('B', 'QRCODE')])
+        self.assertEqual([event.data for event in events], ['B'])
+
+
+class FakeResponse:
+    def __init__(self, status=200, data=None):
+        self.status = status
+        self.will_close = False
+        self.body = json.dumps(data if data is not None else {}).encode('utf-8')
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection:
+    """
+    記錄送出的請求；failures 中的例外依序在 getresponse() 拋出，模擬連線被伺服器關閉。
+    """
+    instances = []
+    sent = []
+    failures = []
+
+    def __init__(self, netloc, timeout=None):
+        self.requests = []
+        self.closed = False
+        FakeConnection.instances.append(self)
+
+    def request(self, method, url, body=None, headers=None):
+        self.requests.append((method, url, json.loads(body) if body else None, headers))
+        FakeConnection.sent.append(self.requests[-1])
+
+    def getresponse(self):
+        if FakeConnection.failures:
+            raise FakeConnection.failures.pop(0)
+        return FakeResponse()
+
+    def close(self):
+        self.closed = True
+
+
+class BackendClientTest(unittest.TestCase):
+    def setUp(self):
+        FakeConnection.instances = []
+        FakeConnection.sent = []
+        FakeConnection.failures = []
+        patcher = mock.patch('http.client.HTTPConnection', FakeConnection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.results = []
+
+    def client(self, mode, **kwargs):
+        kwargs.setdefault('flush_interval', 0.05)
+        return BackendClient('http://backend', token='secret', mode=mode,
+                             on_result=lambda items, data, error: self.results.append((items, error)), **kwargs)
+
+    def test_borrow_batches_up_to_batch_size(self):
+        client = self.client('borrow', flush_interval=5)
+        for book_id in range(scan_events.MAX_BATCH_SIZE + 1):
+            client.submit(book_id=book_id)
+        client.submit(isbn='9780306406157')
+        client.close()
+        self.assertEqual(len(FakeConnection.sent), 2)
+        method, url, payload, headers = FakeConnection.sent[0]
+        self.assertEqual((method, url), ('POST', '/api/books/borrow/batch/'))
+        self.assertEqual(payload, {'book_ids': list(range(50)), 'isbns': []})
+        self.assertEqual(headers['Authorization'], 'Bearer secret')
+        self.assertEqual(FakeConnection.sent[1][2], {'book_ids': [50], 'isbns': ['9780306406157']})
+        # 同一條 keep-alive 連線
+        self.assertEqual(len(FakeConnection.instances), 1)
+
+    def test_flush_interval_sends_partial_batch(self):
+        client = self.client('return', flush_interval=0.05)
+        done = threading.Event()
+        client.on_result = lambda items, data, error: done.set()
+        client.submit(book_id=1)
+        client.submit(book_id=1)
+        self.assertTrue(done.wait(2)) # 未呼叫 close() 也會在 flush_interval 後送出
+        client.close()
+        self.assertEqual(FakeConnection.sent[0][2], {'book_ids': [1], 'isbns': []})
+
+    def test_lookup_is_retried_after_dropped_connection(self):
+        FakeConnection.failures = [http.client.RemoteDisconnected('closed')]
+        client = self.client('lookup')
+        client.submit(isbn='9780306406157')
+        client.close()
+        self.assertEqual([request[:2] for request in FakeConnection.sent], [('GET', '/api/books/isbn/9780306406157/')] * 2)
+        self.assertEqual(self.results, [(['9780306406157'], None)])
+
+    def test_borrow_is_not_resent_after_dropped_connection(self):
+        FakeConnection.failures = [ConnectionResetError('reset')]
+        client = self.client('borrow')
+        client.submit(book_id=7)
+        client.close()
+        self.assertEqual(len(FakeConnection.sent), 1)
+        self.assertEqual(self.results, [([7], 'reset')])
+        self.assertEqual(client.stats['errors'], 1)
+
+    def test_borrow_reconnects_after_idle(self):
+        client = self.client('borrow')
+        client._request('POST', '/api/books/borrow/batch/', {'book_ids': [1]})
+        client._request('POST', '/api/books/borrow/batch/', {'book_ids': [2]})
+        # 閒置超過 POST_IDLE_RECONNECT 秒的連線可能已被伺服器關閉，借書前先重新連線
+        client.last_used -= scan_events.POST_IDLE_RECONNECT + 1
+        client._request('POST', '/api/books/borrow/batch/', {'book_ids': [3]})
+        client.close()
+        self.assertEqual([len(connection.requests) for connection in FakeConnection.instances], [2, 1])
+        self.assertTrue(FakeConnection.instances[0].closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
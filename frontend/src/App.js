@@ -31,6 +31,14 @@ const STATUS_OPTIONS = [
   { value: 'LOST', 'label': '遺失' },
 ];
 
+// authFetch: 帶上登入時取得的 token，後端以 token 辨識使用者，不再傳遞 user_id
+export const authFetch = (url, options = {}) => {
+  const token = localStorage.getItem('token');
+  const headers = { ...(options.headers || {}) };
+  if (token) headers['Authorization'] = `Bearer ${token}`;
+  return fetch(url, { ...options, headers });
+};
+
 // MessageDisplay: 訊息顯示組件  
 const MessageDisplay = ({ message, type }) => {
   if (!message) return null;
@@ -195,7 +203,7 @@ const Login = ({ setCurrentPage }) => {
       if (response.ok) {
         setMessage(data.message); // 設定訊息
         setMessageType('success'); // 設定訊息類型
-        loginUser(data.user_id, data.username); // 登入使用者
+        loginUser(data.user_id, data.username, data.token); // 登入使用者
         // 設定一個定時器在訊息顯示後跳轉頁面
         if (messageTimeoutRef.current) {
           clearTimeout(messageTimeoutRef.current);
@@ -376,7 +384,7 @@ const UserHome = ({ setCurrentPage }) => {
     }
     setLoading(true);
     try {
-      const response = await fetch(`/api/user_home/?user_id=${currentUser.id}`);
+      const response = await authFetch('/api/user_home/');
       const data = await response.json();
 
       if (response.ok) {
@@ -549,10 +557,10 @@ const BookList = ({ setCurrentPage }) => {
     }
 
      try {
-    const response = await fetch(`/api/books/borrow/${books.id}/`, {
+    const response = await authFetch(`/api/books/borrow/${books.id}/`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ user_id: currentUser.id }),
+      body: JSON.stringify({}),
     });
     if (!response.ok) {
       const text = await response.text();
@@ -706,6 +714,8 @@ const BookList = ({ setCurrentPage }) => {
                       `}>
                         {STATUS_OPTIONS.find(option => option.value === book.status)?.label || book.status}
                       </span>
+                      {/* 可借複本數 / 館藏複本數 */}
+                      <span className="ml-2 text-xs text-gray-600">{book.available_copies} / {book.total_copies}</span>
                     </td>
                     <td className="py-3 px-4 space-x-2">
                       {/* 判斷如果使用者名稱是 'yucheng' 則顯示狀態下拉選單和編輯、刪除按鈕 */}
@@ -735,7 +745,7 @@ const BookList = ({ setCurrentPage }) => {
                         </div>
                       ) : (
                         // 非 yucheng 使用者只能借閱
-                        currentUser && currentUser.id && book.status === 'AVAILABLE' && ( // 確保 currentUser 存在
+                        currentUser && currentUser.id && book.status === 'AVAILABLE' && book.available_copies > 0 && ( // 確保 currentUser 存在且仍有可借複本
                           <button
                             onClick={() => handleBorrowBook(book.id, book.title)}
                             className="bg-blue-600 hover:bg-blue-700 text-white font-bold py-1 px-3 rounded-lg text-sm shadow-md transition duration-300 ease-in-out"
@@ -1224,14 +1234,12 @@ const EditProfile = ({ setCurrentPage }) => {
 
     try {
       // 調用後端 API 更新使用者資訊 
-      const response = await fetch('/api/user/update_profile/', {
+      const response = await authFetch('/api/user/update_profile/', {
         method: 'POST', // 或 PUT
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          user_id: currentUser.id, // 傳遞使用者 ID
-          username: currentUser.username, // 傳遞使用者名稱 
           new_password: newPassword,
         }),
       });
@@ -1241,6 +1249,7 @@ const EditProfile = ({ setCurrentPage }) => {
       if (response.ok) {
         setMessage(data.message || '個人資料更新成功！');
         setMessageType('success');
+        if (data.token) localStorage.setItem('token', data.token); // 修改密碼後舊 token 失效
         setNewPassword('');
         setConfirmPassword('');
         if (messageTimeoutRef.current) {
@@ -1392,12 +1401,12 @@ const BookDetail = ({ setCurrentPage, identifier }) => {
 
     if (window.confirm(`確定要借閱 "${book.title}" 嗎？`)) {
       try {
-        const response = await fetch(`/api/books/borrow/${book.id}/`, {
+        const response = await authFetch(`/api/books/borrow/${book.id}/`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify({ user_id: currentUser.id }),
+          body: JSON.stringify({}),
         });
         const data = await response.json();
         if (response.ok) {
@@ -1428,12 +1437,12 @@ const BookDetail = ({ setCurrentPage, identifier }) => {
     if (window.confirm(`確定要歸還 "${book.title}" 嗎？`)) {
       try {
         // 使用新增的根據書籍ID和使用者ID歸還的API
-        const response = await fetch(`/api/books/return_by_book_and_user/`, {
+        const response = await authFetch(`/api/books/return_by_book_and_user/`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify({ book_id: book.id, user_id: currentUser.id }),
+          body: JSON.stringify({ book_id: book.id }),
         });
         const data = await response.json();
         if (response.ok) {
@@ -1492,6 +1501,7 @@ const BookDetail = ({ setCurrentPage, identifier }) => {
               {STATUS_OPTIONS.find(s => s.value === book.status)?.label || book.status}
             </span>
           </p>
+          <p className="md:col-span-2"><strong>可借複本:</strong> {book.available_copies} / {book.total_copies}</p>
           <p className="md:col-span-2"><strong>描述:</strong> {book.description || '無描述'}</p>
         </div>
 
@@ -1812,15 +1822,20 @@ function App() {
   useEffect(() => {
     const userId = localStorage.getItem('user_id');
     const username = localStorage.getItem('username');
-    if (userId && username) setCurrentUser({ id: userId, username: username });
+    const token = localStorage.getItem('token');
+    if (userId && username && token) setCurrentUser({ id: userId, username: username });
   }, []);
 
-  const loginUser = (id, username) => {
+  const loginUser = (id, username, token) => {
     setCurrentUser({ id, username });
     localStorage.setItem('user_id', id);
     localStorage.setItem('username', username);
+    localStorage.setItem('token', token);
   };
   const logoutUser = () => {
+    // 通知後端撤銷 token，失敗時仍清除本地登入狀態
+    authFetch('/api/logout/', { method: 'POST' }).catch(() => {});
+    localStorage.removeItem('token');
     localStorage.removeItem('user_id');
     localStorage.removeItem('username');
     setCurrentUser({ id: null, username: null });
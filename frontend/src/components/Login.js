@@ -28,7 +28,7 @@ const Login = ({ setCurrentPage }) => {
       if (response.ok) {
         setMessage(data.message);
         setMessageType('success');
-        loginUser(data.user_id, data.username); // 更新全局用戶狀態
+        loginUser(data.user_id, data.username, data.token); // 更新全局用戶狀態
         setCurrentPage('user_home'); // 導航到用戶主頁
       } else {
         setMessage(data.message || '登入失敗');